@@ -203,6 +203,16 @@ CREATE OR REPLACE TABLE CUSTOMER_METRICS (
     GENERATED_AT        TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
+-- (Tuỳ chọn) Tra cứu khách hàng trên dashboard (C_CUSTKEY = ?, C_NAME ILIKE
+-- 'tiền tố%'): search optimization để truy vấn điểm chỉ quét vài micro-partition.
+-- - Cần Enterprise Edition trở lên (Standard Edition báo lỗi).
+-- - Tốn thêm chi phí: dung lượng lưu search access path và compute serverless
+--   để dựng/duy trì nó mỗi lần bảng được ghi lại (ở đây là mỗi lần chạy gold).
+-- - SUBSTRING chỉ được dùng khi hằng số tìm kiếm có ít nhất 5 ký tự, khớp với
+--   LOOKUP_MIN_PREFIX = 5 của dashboard.
+-- Bỏ comment khi tài khoản đủ điều kiện và lượng tra cứu bù được chi phí:
+-- ALTER TABLE CUSTOMER_METRICS ADD SEARCH OPTIMIZATION ON EQUALITY(C_CUSTKEY), SUBSTRING(C_NAME);
+
 -- Gold Table 3: PRODUCT_PERFORMANCE
 CREATE OR REPLACE TABLE PRODUCT_PERFORMANCE (
     P_PARTKEY           NUMBER(38,0) PRIMARY KEY,
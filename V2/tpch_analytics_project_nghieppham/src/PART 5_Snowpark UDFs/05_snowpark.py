@@ -11,13 +11,24 @@ from snowflake.snowpark.functions import (
     count_distinct, when, lit, current_date, datediff, 
     date_trunc, year, month, quarter, dayofweek,
     ntile, row_number, rank, dense_rank,
-    round as round_, lag
+    round as round_, lag, when_matched, when_not_matched, approx_percentile, concat
+)
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.types import (
+    IntegerType, FloatType, StringType, DateType, StructType, StructField, TimestampType
 )
-from snowflake.snowpark.types import IntegerType, FloatType, StringType, DateType
 from snowflake.snowpark.window import Window
 import pandas as pd
+import argparse
+import io
 import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from functools import partial
 import json
 
 # =============================================================================
@@ -58,39 +69,112 @@ def create_snowpark_session():
             raise e
 
 # =============================================================================
-# 5.1 CUSTOMER SEGMENTATION WITH RFM ANALYSIS
+# 5.0 SHARED ORDER FACT
 # =============================================================================
 
-def calculate_rfm_segmentation(session):
+SILVER_TABLES = ("CUSTOMER_SILVER", "ORDERS_SILVER", "LINEITEM_SILVER", "PART_SILVER")
+
+def build_order_fact(session, materialize=True):
     """
-    Perform RFM (Recency, Frequency, Monetary) Analysis
-    to segment customers based on their purchasing behavior
+    Build the enriched order-line fact shared by all analyses:
+    ORDERS_SILVER ⋈ LINEITEM_SILVER ⋈ CUSTOMER_SILVER, one row per order line
+    with customer, region, date parts and amounts.
+    
+    With materialize=True the join runs once and its result is cached in a
+    session-scoped temp table (cache_result), so the analyses read the fact
+    instead of re-joining the silver tables. With materialize=False the lazy
+    join is returned and replayed by every query that uses it.
     """
-    print("\n" + "="*80)
-    print("CUSTOMER RFM SEGMENTATION")
-    print("="*80)
-    
-    # Load tables
     customers = session.table("CUSTOMER_SILVER")
     orders = session.table("ORDERS_SILVER")
     lineitems = session.table("LINEITEM_SILVER")
     
-    # Calculate RFM metrics
-    print("\n📊 Calculating RFM metrics...")
-    
-    # Join orders with lineitems to get actual revenue
-    order_revenue = (orders
+    # LEFT join customers: sales/product analyses keep order lines whose
+    # customer is missing from CUSTOMER_SILVER, as the separate joins did
+    fact = (orders
         .join(lineitems, orders["O_ORDERKEY"] == lineitems["L_ORDERKEY"])
+        .join(customers, orders["O_CUSTKEY"] == customers["C_CUSTKEY"], "left")
         .select(
             orders["O_ORDERKEY"],
             orders["O_CUSTKEY"],
             orders["O_ORDERDATE"],
+            orders["O_ORDER_YEAR"],
+            orders["O_ORDER_MONTH"],
+            orders["O_ORDER_QUARTER"],
+            customers["C_CUSTKEY"],
+            customers["C_NATION_NAME"],
+            customers["C_REGION_NAME"],
+            customers["C_MKTSEGMENT"],
+            lineitems["L_PARTKEY"],
+            lineitems["L_QUANTITY"],
+            lineitems["L_EXTENDEDPRICE"],
+            lineitems["L_DISCOUNT"],
             lineitems["L_TOTAL_AMOUNT"]
         )
     )
     
-    # Calculate RFM values
-    rfm_df = (customers
+    if not materialize:
+        return fact
+    
+    print("\n📦 Materializing shared order fact (cache_result)...")
+    return fact.cache_result()
+
+def table_scans(queries, table_names):
+    """
+    Count how many times each table is referenced by the executed queries
+    (from session.query_history()); each reference is one scan
+    """
+    scans = dict.fromkeys(table_names, 0)
+    for query in queries:
+        for name in table_names:
+            pattern = r"\b" + re.escape(name) + r"\b"
+            scans[name] += len(re.findall(pattern, query.sql_text, re.IGNORECASE))
+    return scans
+
+def save_result(df, table_name):
+    """
+    Execute df once into table_name (overwrite) and return the saved table.
+    Summaries are derived from the returned table, so the joins, aggregates
+    and windows behind df are not replayed for every count() or show()
+    """
+    df.write.mode("overwrite").save_as_table(table_name)
+    return df.session.table(table_name)
+
+# =============================================================================
+# 5.1 CUSTOMER SEGMENTATION WITH RFM ANALYSIS
+# =============================================================================
+
+# Raw per-customer RFM values; recency, scores and segments derive from these
+RFM_VALUE_COLUMNS = (
+    "C_CUSTKEY", "C_NAME", "C_NATION_NAME", "C_REGION_NAME", "C_MKTSEGMENT",
+    "LAST_ORDER_DATE", "FIRST_ORDER_DATE", "FREQUENCY", "MONETARY"
+)
+
+# Incremental mode: raw RFM values are kept in CUSTOMER_RFM_VALUES, with the
+# high watermark of the silver rows already folded into them.
+# PROCESSED_TIMESTAMP is set on insert and refreshed when the silver MERGE
+# updates a row (LOAD_TIMESTAMP is not), so rows past the watermark are
+# exactly the new and changed ones. CUSTOMER_RFM_ORDER_OWNERS keeps the
+# customer each order line was counted for, so an order the silver MERGE
+# moves to another customer also re-aggregates its previous customer
+RFM_VALUES_TABLE = "CUSTOMER_RFM_VALUES"
+RFM_WATERMARK_TABLE = "CUSTOMER_RFM_WATERMARK"
+RFM_ORDER_OWNERS_TABLE = "CUSTOMER_RFM_ORDER_OWNERS"
+WATERMARK_COLUMN = "PROCESSED_TIMESTAMP"
+WATERMARK_TABLES = ("CUSTOMER_SILVER", "ORDERS_SILVER", "LINEITEM_SILVER")
+
+# Scoring modes: "exact" ranks customers with NTILE(5) (one global sort per
+# metric), "approx" buckets them on approximate quintile boundaries
+SCORING_MODES = ("exact", "approx")
+RFM_METRICS = ("RECENCY_DAYS", "FREQUENCY", "MONETARY")
+RFM_QUINTILES = (20, 40, 60, 80)
+
+def rfm_values(customers, order_revenue):
+    """
+    Aggregate order lines into raw R/F/M values per customer
+    (customers without orders are kept with FREQUENCY 0)
+    """
+    return (customers
         .join(order_revenue, customers["C_CUSTKEY"] == order_revenue["O_CUSTKEY"], "left")
         .group_by("C_CUSTKEY", "C_NAME", "C_NATION_NAME", "C_REGION_NAME", "C_MKTSEGMENT")
         .agg([
@@ -99,30 +183,77 @@ def calculate_rfm_segmentation(session):
             count("O_ORDERKEY").alias("FREQUENCY"),
             sum_("L_TOTAL_AMOUNT").alias("MONETARY")
         ])
-        .with_column("RECENCY_DAYS", 
-            datediff("day", col("LAST_ORDER_DATE"), current_date()))
-    )
-    
-    # Calculate RFM scores using NTILE (1-5 scale)
-    print("📈 Calculating RFM scores (1-5 scale)...")
-    
-    # Define windows for scoring
-    recency_window = Window.order_by(col("RECENCY_DAYS"))  # Lower recency is better
-    frequency_window = Window.order_by(col("FREQUENCY").desc())  # Higher frequency is better
-    monetary_window = Window.order_by(col("MONETARY").desc())  # Higher monetary is better
-    
-    rfm_scored = (rfm_df
-        .with_column("R_SCORE", 6 - ntile(5).over(recency_window))  # Invert: 1=oldest, 5=newest
-        .with_column("F_SCORE", ntile(5).over(frequency_window))
-        .with_column("M_SCORE", ntile(5).over(monetary_window))
     )
+
+def quintile_boundaries(rfm_df):
+    """
+    One-row DataFrame with the approximate 20/40/60/80th percentiles of each
+    RFM metric (<METRIC>_P<n>), computed in a single aggregation without sorting
+    """
+    return rfm_df.agg([
+        approx_percentile(metric, p / 100).alias(f"{metric}_P{p}")
+        for metric in RFM_METRICS for p in RFM_QUINTILES
+    ])
+
+def quintile_bucket(metric, descending=False):
+    """
+    Quintile (1-5) of a metric from its boundary columns, numbered like
+    ntile(5) over the same ordering: 1 = lowest values, or highest when
+    descending. NULLs go where Snowflake sorts them (last ascending, first
+    descending). Ties always share a bucket, where NTILE may split them.
+    """
+    value = col(metric)
+    if descending:
+        bucket = when(value.is_null(), lit(1))
+        for score, p in enumerate(reversed(RFM_QUINTILES), start=1):
+            bucket = bucket.when(value >= col(f"{metric}_P{p}"), lit(score))
+    else:
+        bucket = when(value.is_null(), lit(5))
+        for score, p in enumerate(RFM_QUINTILES, start=1):
+            bucket = bucket.when(value <= col(f"{metric}_P{p}"), lit(score))
+    return bucket.otherwise(lit(5))
+
+def score_rfm(rfm_df, scoring="exact"):
+    """
+    Add recency, R/F/M scores (1-5), RFM segment and value columns to raw
+    RFM values. Scores rank each customer against all others, so they are
+    always computed over the full customer set.
+    
+    scoring="exact" uses NTILE(5) windows; "approx" computes the quintile
+    boundaries once with APPROX_PERCENTILE and assigns scores with CASE
+    against them (one-row cross join), avoiding three global sorts. The
+    approx query reads rfm_df twice, so pass saved or cached values rather
+    than the lazy aggregation.
+    """
+    rfm_df = rfm_df.with_column("RECENCY_DAYS", 
+        datediff("day", col("LAST_ORDER_DATE"), current_date()))
+    
+    if scoring == "approx":
+        rfm_scored = (rfm_df
+            .cross_join(quintile_boundaries(rfm_df))
+            .with_column("R_SCORE", 6 - quintile_bucket("RECENCY_DAYS"))  # Invert: 1=oldest, 5=newest
+            .with_column("F_SCORE", quintile_bucket("FREQUENCY", descending=True))
+            .with_column("M_SCORE", quintile_bucket("MONETARY", descending=True))
+            .drop(*[f"{metric}_P{p}" for metric in RFM_METRICS for p in RFM_QUINTILES])
+        )
+    else:
+        # Define windows for scoring
+        recency_window = Window.order_by(col("RECENCY_DAYS"))  # Lower recency is better
+        frequency_window = Window.order_by(col("FREQUENCY").desc())  # Higher frequency is better
+        monetary_window = Window.order_by(col("MONETARY").desc())  # Higher monetary is better
+        
+        rfm_scored = (rfm_df
+            .with_column("R_SCORE", 6 - ntile(5).over(recency_window))  # Invert: 1=oldest, 5=newest
+            .with_column("F_SCORE", ntile(5).over(frequency_window))
+            .with_column("M_SCORE", ntile(5).over(monetary_window))
+        )
     
     # Create RFM segment
-    rfm_final = (rfm_scored
-        .with_column("RFM_SCORE", 
-            col("R_SCORE").cast(StringType()) + 
-            col("F_SCORE").cast(StringType()) + 
-            col("M_SCORE").cast(StringType()))
+    return (rfm_scored
+        .with_column("RFM_SCORE",  # e.g. "545"; + on strings is numeric addition in Snowflake
+            concat(col("R_SCORE").cast(StringType()),
+                   col("F_SCORE").cast(StringType()),
+                   col("M_SCORE").cast(StringType())))
         .with_column("RFM_SEGMENT",
             when((col("R_SCORE") >= 4) & (col("F_SCORE") >= 4) & (col("M_SCORE") >= 4), 
                  lit("Champion"))
@@ -141,18 +272,194 @@ def calculate_rfm_segmentation(session):
             when(col("FREQUENCY") > 0, col("MONETARY") / col("FREQUENCY"))
             .otherwise(lit(0)))
     )
+
+def compare_rfm_scoring(rfm_saved, scoring):
+    """
+    Re-score saved RFM values with the other scoring mode and report how many
+    customers land in a different segment (reads only the saved table)
+    """
+    other = "approx" if scoring == "exact" else "exact"
+    rescored = score_rfm(rfm_saved.select(*RFM_VALUE_COLUMNS), other)
+    
+    def scores(df, mode):
+        return df.select(
+            "C_CUSTKEY",
+            col("RFM_SEGMENT").alias(f"{mode.upper()}_SEGMENT"),
+            col("RFM_SCORE").alias(f"{mode.upper()}_SCORE")
+        )
+    
+    transitions = pd.DataFrame([row.as_dict() for row in (scores(rfm_saved, scoring)
+        .join(scores(rescored, other), "C_CUSTKEY")
+        .group_by("EXACT_SEGMENT", "APPROX_SEGMENT")
+        .agg([
+            count("C_CUSTKEY").alias("CUSTOMERS"),
+            sum_(when(col("EXACT_SCORE") != col("APPROX_SCORE"), lit(1)).otherwise(lit(0)))
+                .alias("SCORE_CHANGED")
+        ])
+        .order_by(col("CUSTOMERS").desc())
+        .collect())])
+    
+    total = int(transitions["CUSTOMERS"].sum()) if len(transitions) else 0
+    moved = transitions[transitions["EXACT_SEGMENT"] != transitions["APPROX_SEGMENT"]]
+    changed = int(moved["CUSTOMERS"].sum()) if len(moved) else 0
+    rescored_count = int(transitions["SCORE_CHANGED"].sum()) if len(transitions) else 0
+    
+    print("\n🔍 Exact (NTILE) vs approximate quintile scoring:")
+    print(f"   Customers changing segment: {changed:,} of {total:,}"
+          f" ({changed / total * 100 if total else 0:.2f}%)")
+    print(f"   Customers with a different RFM score: {rescored_count:,}")
+    if changed:
+        print(moved[["EXACT_SEGMENT", "APPROX_SEGMENT", "CUSTOMERS"]].to_string(index=False))
+    return transitions
+
+def read_watermark(session):
+    """Watermark saved by the last incremental run, None if there is none yet"""
+    try:
+        rows = session.table(RFM_WATERMARK_TABLE).collect()
+    except SnowparkSQLException:
+        return None
+    return rows[0]["WATERMARK"] if rows else None
+
+def silver_high_watermark(session):
+    """Latest PROCESSED_TIMESTAMP across the silver tables RFM reads"""
+    stamps = None
+    for table_name in WATERMARK_TABLES:
+        table = session.table(table_name).select(col(WATERMARK_COLUMN))
+        stamps = table if stamps is None else stamps.union_all(table)
+    return stamps.select(max_(WATERMARK_COLUMN)).collect()[0][0]
+
+def save_watermark(session, watermark):
+    schema = StructType([
+        StructField("WATERMARK", TimestampType()),
+        StructField("UPDATED_AT", TimestampType())
+    ])
+    (session.create_dataframe([[watermark, datetime.now()]], schema=schema)
+        .write.mode("overwrite").save_as_table(RFM_WATERMARK_TABLE))
+
+def order_owners(order_revenue):
+    """Order -> customer pairs of the order lines RFM values are built from"""
+    return order_revenue.select("O_ORDERKEY", "O_CUSTKEY").distinct()
+
+def changed_customers(session, since, until):
+    """
+    Keys of customers with a customer, order or order-line row processed in
+    (since, until]; a changed line re-aggregates the customer of its order.
+    ORDERS_SILVER only holds the new O_CUSTKEY of an updated order, so the
+    customer it was counted for before comes from CUSTOMER_RFM_ORDER_OWNERS
+    """
+    def processed(table_name):
+        stamp = col(WATERMARK_COLUMN)
+        return session.table(table_name).filter(
+            (stamp > lit(since, TimestampType())) & (stamp <= lit(until, TimestampType())))
+    
+    orders = session.table("ORDERS_SILVER")
+    owners = session.table(RFM_ORDER_OWNERS_TABLE)
+    changed_orders = processed("ORDERS_SILVER")
+    changed_lines = processed("LINEITEM_SILVER")
+    return (processed("CUSTOMER_SILVER").select("C_CUSTKEY")
+        .union(changed_orders.select(col("O_CUSTKEY").alias("C_CUSTKEY")))
+        .union(owners
+            .join(changed_orders, owners["O_ORDERKEY"] == changed_orders["O_ORDERKEY"], "leftsemi")
+            .select(col("O_CUSTKEY").alias("C_CUSTKEY")))
+        .union(orders
+            .join(changed_lines, orders["O_ORDERKEY"] == changed_lines["L_ORDERKEY"], "leftsemi")
+            .select(col("O_CUSTKEY").alias("C_CUSTKEY")))
+    )
+
+def merge_rfm_values(session, customers, order_revenue, since, until):
+    """
+    Re-aggregate the R/F/M values of customers changed in (since, until]
+    over their full order history and MERGE them into CUSTOMER_RFM_VALUES,
+    then record which customer their orders now count for
+    """
+    changed = changed_customers(session, since, until)
+    changed_revenue = order_revenue.join(changed, order_revenue["O_CUSTKEY"] == changed["C_CUSTKEY"], "leftsemi")
+    delta = rfm_values(customers.join(changed, "C_CUSTKEY", "leftsemi"), changed_revenue)
+    
+    target = session.table(RFM_VALUES_TABLE)
+    values = {name: delta[name] for name in RFM_VALUE_COLUMNS}
+    result = target.merge(
+        delta,
+        target["C_CUSTKEY"] == delta["C_CUSTKEY"],
+        [when_matched().update(values), when_not_matched().insert(values)]
+    )
+    print(f"   Customers re-aggregated: {result.rows_updated} updated, {result.rows_inserted} new")
+    
+    owners = session.table(RFM_ORDER_OWNERS_TABLE)
+    moved = order_owners(changed_revenue)
+    owners.merge(
+        moved,
+        owners["O_ORDERKEY"] == moved["O_ORDERKEY"],
+        [when_matched().update({"O_CUSTKEY": moved["O_CUSTKEY"]}),
+         when_not_matched().insert({"O_ORDERKEY": moved["O_ORDERKEY"], "O_CUSTKEY": moved["O_CUSTKEY"]})]
+    )
+
+def calculate_rfm_segmentation(session, fact=None, until=None, incremental=False, scoring="exact",
+                               compare_scoring=False):
+    """
+    Perform RFM (Recency, Frequency, Monetary) Analysis
+    to segment customers based on their purchasing behavior.
+    
+    With incremental=True only customers with silver rows processed since the
+    last incremental run are re-aggregated and merged into CUSTOMER_RFM_VALUES;
+    scores are then recomputed over all values. The first incremental run (no
+    watermark yet) aggregates every customer into CUSTOMER_RFM_VALUES. until
+    is the silver high watermark the run covers; pass one read before the
+    fact was built (see pipeline_steps), otherwise it is read here.
+    
+    scoring selects NTILE ("exact") or approximate quintile ("approx") scores;
+    compare_scoring also reports how many segments the other mode would change.
+    """
+    print("\n" + "="*80)
+    print("CUSTOMER RFM SEGMENTATION")
+    print("="*80)
+    
+    # Load tables
+    customers = session.table("CUSTOMER_SILVER")
+    if fact is None:
+        fact = build_order_fact(session, materialize=False)
+    
+    # Order lines with actual revenue (from the shared fact)
+    order_revenue = fact.select("O_ORDERKEY", "O_CUSTKEY", "O_ORDERDATE", "L_TOTAL_AMOUNT")
+    
+    since = None
+    if incremental:
+        since = read_watermark(session)
+        if until is None:
+            until = silver_high_watermark(session)
+        if since is None:
+            print("\nℹ️ No RFM watermark yet, running a full RFM calculation")
+    
+    if since is None:
+        # Calculate RFM metrics
+        print("\n📊 Calculating RFM metrics...")
+        rfm_df = rfm_values(customers, order_revenue)
+        if incremental:
+            rfm_df = save_result(rfm_df, RFM_VALUES_TABLE)
+            save_result(order_owners(order_revenue), RFM_ORDER_OWNERS_TABLE)
+        elif scoring == "approx":
+            # Boundaries and scores both read the values: aggregate them once
+            rfm_df = rfm_df.cache_result()
+    else:
+        print(f"\n📊 Re-aggregating RFM metrics of customers changed after {since}...")
+        merge_rfm_values(session, customers, order_revenue, since, until)
+        rfm_df = session.table(RFM_VALUES_TABLE)
+    
+    # Calculate RFM scores (1-5 scale)
+    print(f"📈 Calculating RFM scores (1-5 scale, {scoring} quintiles)...")
+    rfm_final = score_rfm(rfm_df, scoring)
     
     # Save to Snowflake table
     print("\n💾 Saving RFM results to CUSTOMER_RFM_SCORES table...")
-    rfm_final.write.mode("overwrite").save_as_table("CUSTOMER_RFM_SCORES")
+    rfm_saved = save_result(rfm_final, "CUSTOMER_RFM_SCORES")
     
-    # Display summary statistics
+    # Display summary statistics (from the saved table)
     print(f"\n✅ RFM Segmentation completed!")
-    print(f"   Total customers processed: {rfm_final.count()}")
+    print(f"   Total customers processed: {rfm_saved.count()}")
     
     # Show segment distribution
     print("\n📊 Customer Segment Distribution:")
-    segment_dist = (rfm_final
+    segment_dist = (rfm_saved
         .group_by("RFM_SEGMENT")
         .agg([
             count("C_CUSTKEY").alias("CUSTOMER_COUNT"),
@@ -166,7 +473,7 @@ def calculate_rfm_segmentation(session):
     
     # Show top 10 champions
     print("\n🏆 Top 10 Champion Customers:")
-    champions = (rfm_final
+    champions = (rfm_saved
         .filter(col("RFM_SEGMENT") == "Champion")
         .select(
             "C_CUSTKEY", "C_NAME", "C_NATION_NAME", "C_REGION_NAME",
@@ -177,13 +484,20 @@ def calculate_rfm_segmentation(session):
     )
     champions.show()
     
-    return rfm_final
+    if compare_scoring:
+        compare_rfm_scoring(rfm_saved, scoring)
+    
+    if incremental and until is not None:
+        save_watermark(session, until)
+        print(f"\n✅ RFM watermark moved to {until}")
+    
+    return rfm_saved
 
 # =============================================================================
 # 5.2 SALES TREND ANALYSIS
 # =============================================================================
 
-def analyze_sales_trends(session):
+def analyze_sales_trends(session, fact=None):
     """
     Analyze sales trends over time with various aggregations
     """
@@ -191,25 +505,21 @@ def analyze_sales_trends(session):
     print("SALES TREND ANALYSIS")
     print("="*80)
     
-    # Load tables
-    orders = session.table("ORDERS_SILVER")
-    lineitems = session.table("LINEITEM_SILVER")
+    if fact is None:
+        fact = build_order_fact(session, materialize=False)
     
-    # Join orders with lineitems
+    # Order lines with date parts (from the shared fact)
     print("\n📊 Analyzing sales trends...")
     
-    order_details = (orders
-        .join(lineitems, orders["O_ORDERKEY"] == lineitems["L_ORDERKEY"])
-        .select(
-            orders["O_ORDERKEY"],
-            orders["O_ORDERDATE"],
-            orders["O_ORDER_YEAR"],
-            orders["O_ORDER_MONTH"],
-            orders["O_ORDER_QUARTER"],
-            orders["O_CUSTKEY"],
-            lineitems["L_QUANTITY"],
-            lineitems["L_TOTAL_AMOUNT"]
-        )
+    order_details = fact.select(
+        "O_ORDERKEY",
+        "O_ORDERDATE",
+        "O_ORDER_YEAR",
+        "O_ORDER_MONTH",
+        "O_ORDER_QUARTER",
+        "O_CUSTKEY",
+        "L_QUANTITY",
+        "L_TOTAL_AMOUNT"
     )
     
     # Monthly aggregation
@@ -242,12 +552,12 @@ def analyze_sales_trends(session):
     )
     
     # Save monthly trends
-    monthly_with_growth.write.mode("overwrite").save_as_table("MONTHLY_SALES_TRENDS")
+    monthly_saved = save_result(monthly_with_growth, "MONTHLY_SALES_TRENDS")
     print(f"\n✅ Monthly sales trends saved to MONTHLY_SALES_TRENDS table")
     
     # Show recent months
     print("\n📊 Recent Monthly Performance (Last 12 months):")
-    recent_months = monthly_with_growth.order_by(col("MONTH_START").desc()).limit(12)
+    recent_months = monthly_saved.order_by(col("MONTH_START").desc()).limit(12)
     recent_months.show()
     
     # Quarterly aggregation
@@ -263,9 +573,9 @@ def analyze_sales_trends(session):
         .sort("O_ORDER_YEAR", "O_ORDER_QUARTER")
     )
     
-    quarterly_sales.write.mode("overwrite").save_as_table("QUARTERLY_SALES_TRENDS")
+    quarterly_saved = save_result(quarterly_sales, "QUARTERLY_SALES_TRENDS")
     print(f"\n✅ Quarterly sales trends saved to QUARTERLY_SALES_TRENDS table")
-    quarterly_sales.show()
+    quarterly_saved.sort("O_ORDER_YEAR", "O_ORDER_QUARTER").show()
     
     # Day of week analysis
     print("\n📊 Sales by Day of Week:")
@@ -291,13 +601,13 @@ def analyze_sales_trends(session):
     
     dow_sales.show()
     
-    return monthly_with_growth
+    return monthly_saved
 
 # =============================================================================
 # 5.3 PRODUCT ANALYSIS
 # =============================================================================
 
-def analyze_product_performance(session):
+def analyze_product_performance(session, fact=None):
     """
     Analyze product performance and identify top performers
     """
@@ -307,11 +617,15 @@ def analyze_product_performance(session):
     
     # Load tables
     parts = session.table("PART_SILVER")
-    lineitems = session.table("LINEITEM_SILVER")
+    if fact is None:
+        fact = build_order_fact(session, materialize=False)
     
     # Product performance metrics
     print("\n📊 Calculating product metrics...")
     
+    lineitems = fact.select(
+        "O_ORDERKEY", "L_PARTKEY", "L_QUANTITY", "L_EXTENDEDPRICE", "L_DISCOUNT", "L_TOTAL_AMOUNT"
+    )
     product_metrics = (lineitems
         .join(parts, lineitems["L_PARTKEY"] == parts["P_PARTKEY"])
         .group_by(
@@ -327,7 +641,7 @@ def analyze_product_performance(session):
             sum_("L_TOTAL_AMOUNT").alias("TOTAL_REVENUE"),
             avg("L_EXTENDEDPRICE").alias("AVG_PRICE"),
             avg("L_DISCOUNT").alias("AVG_DISCOUNT"),
-            count_distinct("L_ORDERKEY").alias("ORDER_COUNT")
+            count_distinct("O_ORDERKEY").alias("ORDER_COUNT")
         ])
     )
     
@@ -341,17 +655,17 @@ def analyze_product_performance(session):
     )
     
     # Save results
-    product_ranked.write.mode("overwrite").save_as_table("PRODUCT_ANALYSIS_RESULTS")
+    product_saved = save_result(product_ranked, "PRODUCT_ANALYSIS_RESULTS")
     print(f"\n✅ Product analysis saved to PRODUCT_ANALYSIS_RESULTS table")
     
     # Show top 20 products by revenue
     print("\n🏆 Top 20 Products by Revenue:")
-    top_products = product_ranked.filter(col("REVENUE_RANK") <= 20)
+    top_products = product_saved.filter(col("REVENUE_RANK") <= 20).sort("REVENUE_RANK")
     top_products.show()
     
     # Category analysis
     print("\n📊 Performance by Product Type Category:")
-    category_performance = (product_ranked
+    category_performance = (product_saved
         .group_by("P_TYPE_CATEGORY")
         .agg([
             count("P_PARTKEY").alias("PRODUCT_COUNT"),
@@ -363,13 +677,13 @@ def analyze_product_performance(session):
     )
     category_performance.show()
     
-    return product_ranked
+    return product_saved
 
 # =============================================================================
 # 5.4 REGIONAL PERFORMANCE ANALYSIS
 # =============================================================================
 
-def analyze_regional_performance(session):
+def analyze_regional_performance(session, fact=None):
     """
     Analyze sales performance by region and nation
     """
@@ -377,17 +691,15 @@ def analyze_regional_performance(session):
     print("REGIONAL PERFORMANCE ANALYSIS")
     print("="*80)
     
-    # Load tables
-    customers = session.table("CUSTOMER_SILVER")
-    orders = session.table("ORDERS_SILVER")
-    lineitems = session.table("LINEITEM_SILVER")
+    if fact is None:
+        fact = build_order_fact(session, materialize=False)
     
     # Regional metrics
     print("\n🌍 Calculating regional performance...")
     
-    regional_metrics = (customers
-        .join(orders, customers["C_CUSTKEY"] == orders["O_CUSTKEY"])
-        .join(lineitems, orders["O_ORDERKEY"] == lineitems["L_ORDERKEY"])
+    # Only order lines with a known customer (inner join semantics)
+    regional_metrics = (fact
+        .filter(col("C_CUSTKEY").is_not_null())
         .group_by("C_REGION_NAME", "C_NATION_NAME", "C_MKTSEGMENT")
         .agg([
             count_distinct("C_CUSTKEY").alias("CUSTOMER_COUNT"),
@@ -398,23 +710,21 @@ def analyze_regional_performance(session):
         ])
     )
     
-    # Calculate market share
-    total_revenue = regional_metrics.select(sum_("TOTAL_REVENUE")).collect()[0][0]
-    
+    # Calculate market share (grand total as a window, in the same query)
     regional_with_share = (regional_metrics
         .with_column("MARKET_SHARE_PCT", 
-            (col("TOTAL_REVENUE") / lit(total_revenue) * 100))
+            (col("TOTAL_REVENUE") / sum_("TOTAL_REVENUE").over() * 100))
         .with_column("REVENUE_PER_CUSTOMER",
             col("TOTAL_REVENUE") / col("CUSTOMER_COUNT"))
     )
     
     # Save results
-    regional_with_share.write.mode("overwrite").save_as_table("REGIONAL_PERFORMANCE_ANALYSIS")
+    regional_saved = save_result(regional_with_share, "REGIONAL_PERFORMANCE_ANALYSIS")
     print(f"\n✅ Regional analysis saved to REGIONAL_PERFORMANCE_ANALYSIS table")
     
     # Show regional summary
     print("\n🌍 Top Regions by Revenue:")
-    regional_summary = (regional_with_share
+    regional_summary = (regional_saved
         .group_by("C_REGION_NAME")
         .agg([
             sum_("TOTAL_REVENUE").alias("REGION_REVENUE"),
@@ -426,16 +736,225 @@ def analyze_regional_performance(session):
     )
     regional_summary.show()
     
-    return regional_with_share
+    return regional_saved
+
+# =============================================================================
+# PIPELINE EXECUTOR
+# =============================================================================
+
+FACT_STEP = "Shared Order Fact"
+WATERMARK_STEP = "RFM Watermark"
+
+def pipeline_steps(args):
+    """
+    Steps of the analytics pipeline. Each step declares the steps it depends
+    on (their results are passed to it after the session), optionally steps
+    it only runs after, the silver tables each read of the shared fact stands
+    in for, and its query budget: the max queries allowed to read the fact /
+    silver tables. Results are persisted once and summarized from their saved
+    table, so the budget is one query per saved result plus any summary shown
+    straight from the source (day-of-week sales). Incremental RFM also writes
+    the order owners it counted (CUSTOMER_RFM_ORDER_OWNERS).
+    
+    In incremental mode the silver high watermark is read before the fact is
+    built and handed to RFM Segmentation: reading it after would move the
+    watermark past rows processed while the fact was built, which the fact
+    does not contain.
+    """
+    watermark = (WATERMARK_STEP,) if args.incremental else ()
+    steps = [
+        {"name": FACT_STEP, "run": partial(build_order_fact, materialize=not args.no_shared_fact),
+         "depends_on": (), "after": watermark, "replaces": (), "budget": 1},
+        {"name": "RFM Segmentation", "run": partial(calculate_rfm_segmentation, incremental=args.incremental,
+                                                    scoring=args.scoring, compare_scoring=args.compare_scoring),
+         "depends_on": (FACT_STEP, *watermark), "replaces": ("ORDERS_SILVER", "LINEITEM_SILVER"),
+         "budget": 2 if args.incremental else 1},
+        {"name": "Sales Trends", "run": analyze_sales_trends,
+         "depends_on": (FACT_STEP,), "replaces": ("ORDERS_SILVER", "LINEITEM_SILVER"), "budget": 3},
+        {"name": "Product Performance", "run": analyze_product_performance,
+         "depends_on": (FACT_STEP,), "replaces": ("LINEITEM_SILVER",), "budget": 1},
+        {"name": "Regional Performance", "run": analyze_regional_performance,
+         "depends_on": (FACT_STEP,), "replaces": ("CUSTOMER_SILVER", "ORDERS_SILVER", "LINEITEM_SILVER"), "budget": 1},
+    ]
+    if args.incremental:
+        steps.insert(0, {"name": WATERMARK_STEP, "run": silver_high_watermark,
+                         "depends_on": (), "replaces": (), "budget": 1})
+    return steps
+
+class ThreadOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout while steps run concurrently: writes from a
+    thread with a registered buffer go to that buffer, all other writes to
+    the real stdout, so each step's output is printed as one block
+    """
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+    
+    def write(self, text):
+        return self.buffers.get(threading.get_ident(), self.stream).write(text)
+    
+    def flush(self):
+        self.stream.flush()
+
+def run_step(step, session, history, output, dependencies):
+    """
+    Run one step in the current worker thread. Returns its result, duration,
+    the queries it issued (picked from the shared history by thread id; a
+    worker runs one step at a time) and its buffered output
+    """
+    thread = threading.get_ident()
+    before = sum(1 for query in history.queries if query.thread_id == thread)
+    buffer = output.buffers[thread] = io.StringIO()
+    started = time.perf_counter()
+    try:
+        result = step["run"](session, *dependencies)
+    except Exception:
+        output.stream.write(buffer.getvalue())
+        raise
+    finally:
+        del output.buffers[thread]
+    elapsed = time.perf_counter() - started
+    queries = [query for query in history.queries if query.thread_id == thread][before:]
+    return result, elapsed, queries, buffer.getvalue()
+
+def run_pipeline(session, steps, max_workers):
+    """
+    Run steps on a thread pool: each step is submitted as soon as all steps it
+    depends on have finished, with at most max_workers running at once.
+    Returns (results, seconds, queries) keyed by step name, and the wall-clock
+    seconds of the whole pipeline
+    
+    Queries are attributed to steps by thread id (query_history records it
+    from snowflake-snowpark-python 1.24 on, see requirements.txt)
+    """
+    pending = {step["name"]: step for step in steps}
+    results, seconds, queries = {}, {}, {}
+    output = ThreadOutput(sys.stdout)
+    started = time.perf_counter()
+    
+    with session.query_history(include_thread_id=True) as history, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snowpark-step") as pool:
+        running = {}
+        sys.stdout = output
+        try:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    if all(dependency in results
+                           for dependency in (*step["depends_on"], *step.get("after", ()))):
+                        del pending[name]
+                        dependencies = [results[dependency] for dependency in step["depends_on"]]
+                        future = pool.submit(run_step, step, session, history, output, dependencies)
+                        running[future] = name
+                if not running:
+                    raise ValueError(f"Unresolvable step dependencies: {', '.join(pending)}")
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name], seconds[name], queries[name], text = future.result()
+                    output.stream.write(text)
+        finally:
+            sys.stdout = output.stream
+    
+    return results, seconds, queries, time.perf_counter() - started
 
 # =============================================================================
 # MAIN EXECUTION
 # =============================================================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TPC-H analytics with Snowpark Python")
+    parser.add_argument("--no-shared-fact", action="store_true",
+                        help="Do not materialize the shared order fact; every query re-joins the silver tables")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-aggregate RFM values only for customers with silver rows processed "
+                             "since the last incremental run (PROCESSED_TIMESTAMP watermark)")
+    parser.add_argument("--scoring", choices=SCORING_MODES, default="exact",
+                        help="RFM scores from NTILE windows (exact) or approximate quintile boundaries (approx)")
+    parser.add_argument("--compare-scoring", action="store_true",
+                        help="Also report how many customers change RFM segment between exact and approx scoring")
+    parser.add_argument("--max-workers", type=int, default=4,
+                        help="Max analyses running at once (1 = sequential); keep within the warehouse's concurrency")
+    return parser.parse_args(argv)
+
+def scan_row(step, queries, budget, seconds, fact_name=None, replaces=()):
+    """
+    One line of the run report: duration and silver-table scans issued by a
+    step, queries reading the shared fact and the silver scans those reads
+    avoided, and how many queries read the source (fact or silver tables)
+    against the step's budget. A query naming the fact more than once (e.g.
+    in two subqueries) counts as one fact read
+    """
+    tables = SILVER_TABLES + ((fact_name,) if fact_name else ())
+    scans = table_scans(queries, tables)
+    fact_reads = 0
+    if fact_name:
+        scans.pop(fact_name)
+        fact_reads = sum(1 for query in queries if table_scans([query], (fact_name,))[fact_name])
+    source_queries = sum(1 for query in queries if any(table_scans([query], tables).values()))
+    return {
+        "STEP": step,
+        "SECONDS": round(seconds, 1),
+        "QUERIES": len(queries),
+        **scans,
+        "FACT_READS": fact_reads,
+        "SCANS_AVOIDED": fact_reads * len(replaces),
+        "SOURCE_QUERIES": source_queries,
+        "BUDGET": budget,
+    }
+
+def print_run_report(rows, wall_seconds, max_workers):
+    report = pd.DataFrame(rows)
+    totals = {column: report[column].sum() for column in report.columns if column != "STEP"}
+    report.loc[len(report)] = {"STEP": "TOTAL", **totals}
+    print("\n📉 Time and silver-layer scans per step:")
+    print(report.to_string(index=False))
+    
+    step_seconds = totals["SECONDS"]
+    print(f"\n⏱️ Wall clock {wall_seconds:.1f}s vs {step_seconds:.1f}s sum of step times "
+          f"({step_seconds / wall_seconds:.1f}x, max {max_workers} workers)")
+    
+    built = sum(row[name] for row in rows if row["STEP"] == FACT_STEP for name in SILVER_TABLES)
+    avoided = int(totals["SCANS_AVOIDED"])
+    if avoided:
+        print(f"✅ Shared order fact: built with {built} silver scans, "
+              f"avoided {avoided} ({avoided - built} net)")
+
+def report_rows(steps, results, seconds, queries, shared_fact=True):
+    """scan_row for every step of a run_pipeline result"""
+    fact_name = results[FACT_STEP].table_name.split(".")[-1].strip('"') if shared_fact else None
+    return [
+        scan_row(step["name"], queries[step["name"]], step["budget"], seconds[step["name"]],
+                 fact_name, step["replaces"])
+        for step in steps
+    ]
+
+def query_budget_overruns(rows):
+    """Report rows of the steps that read their source in more queries than budgeted"""
+    return [row for row in rows if row["SOURCE_QUERIES"] > row["BUDGET"]]
+
+def check_query_budget(rows):
+    """
+    Warn when a step read its source in more queries than budgeted, i.e. a
+    result is no longer persisted once and summarized from its table.
+    Only a warning: the results are already saved by now, and the counts
+    come from table names in the query text. The budget itself is asserted
+    by tests/test_query_budget.py
+    """
+    over = query_budget_overruns(rows)
+    if over:
+        details = ", ".join(f"{row['STEP']} {row['SOURCE_QUERIES']}/{row['BUDGET']}" for row in over)
+        print(f"\n⚠️ Query budget exceeded (queries reading the source / budget): {details}")
+    return over
+
+def main(argv=None):
     """
     Main execution function
     """
+    args = parse_args(argv)
+    
     print("\n" + "="*80)
     print("TPC-H ANALYTICS - SNOWPARK PYTHON")
     print("="*80)
@@ -445,32 +964,31 @@ def main():
         # Create Snowpark session
         session = create_snowpark_session()
         
-        # Run all analyses
-        print("\n🚀 Starting analytics pipeline...")
+        # Run all analyses: the shared order fact first (after the RFM
+        # watermark in incremental mode), then RFM Segmentation, Sales
+        # Trends, Product Performance and Regional Performance concurrently
+        # (each depends only on the fact, RFM also on the watermark)
+        print(f"\n🚀 Starting analytics pipeline (max {args.max_workers} concurrent steps)...")
+        steps = pipeline_steps(args)
+        results, seconds, queries, wall_seconds = run_pipeline(session, steps, args.max_workers)
         
-        # 1. RFM Segmentation
-        rfm_results = calculate_rfm_segmentation(session)
-        
-        # 2. Sales Trend Analysis
-        sales_trends = analyze_sales_trends(session)
-        
-        # 3. Product Performance Analysis
-        product_analysis = analyze_product_performance(session)
-        
-        # 4. Regional Performance Analysis
-        regional_analysis = analyze_regional_performance(session)
+        rows = report_rows(steps, results, seconds, queries, shared_fact=not args.no_shared_fact)
         
         # Summary
         print("\n" + "="*80)
         print("✅ ALL ANALYSES COMPLETED SUCCESSFULLY!")
         print("="*80)
         print("\nGenerated Tables:")
-        print("  1. CUSTOMER_RFM_SCORES")
+        print("  1. CUSTOMER_RFM_SCORES" + (f" (+ {RFM_VALUES_TABLE}, {RFM_ORDER_OWNERS_TABLE}, {RFM_WATERMARK_TABLE})"
+                                         if args.incremental else ""))
         print("  2. MONTHLY_SALES_TRENDS")
         print("  3. QUARTERLY_SALES_TRENDS")
         print("  4. PRODUCT_ANALYSIS_RESULTS")
         print("  5. REGIONAL_PERFORMANCE_ANALYSIS")
         
+        print_run_report(rows, wall_seconds, args.max_workers)
+        check_query_budget(rows)
+        
         print(f"\nExecution completed at: {datetime.now()}")
         
         # Close session
@@ -0,0 +1,243 @@
+"""
+Query budget and step scheduling of the Snowpark analytics pipeline (src/PART 5_Snowpark UDFs/05_snowpark.py).
+
+The unit tests feed run_pipeline / scan_row a mocked query history, and run
+the real pipeline steps on a Snowpark local testing session (small in-memory
+silver tables) to count the actions each step issues. The integration test
+runs the real pipeline against Snowflake and only runs when
+TPCH_SNOWPARK_INTEGRATION=1 (it reads config.json from the working directory
+and overwrites the analysis tables, like 05_snowpark.py itself):
+
+    pytest V2/tpch_analytics_project_nghieppham/tests
+    TPCH_SNOWPARK_INTEGRATION=1 pytest V2/tpch_analytics_project_nghieppham/tests
+"""
+
+import importlib.util
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "src" / "PART 5_Snowpark UDFs" / "05_snowpark.py"
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    # The file name starts with a digit and its folder has spaces: load it by path
+    spec = importlib.util.spec_from_file_location("snowpark_pipeline", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeSession:
+    """Session stand-in whose "queries" are recorded in its query history"""
+
+    def __init__(self):
+        self.history = SimpleNamespace(queries=[])
+
+    @contextmanager
+    def query_history(self, **kwargs):
+        yield self.history
+
+    def sql(self, text):
+        query = SimpleNamespace(sql_text=text, thread_id=threading.get_ident())
+        self.history.queries.append(query)
+        return query
+
+
+@pytest.fixture
+def local_session(pipeline):
+    """Snowpark local testing session holding a few silver rows of every table the pipeline reads"""
+    from snowflake.snowpark import Session
+    from snowflake.snowpark.mock import ColumnEmulator, ColumnType, patch
+    from snowflake.snowpark.types import LongType
+
+    # Local testing has no DAYOFWEEK: 0 = Sunday, like Snowflake's default
+    @patch(pipeline.dayofweek)
+    def dayofweek(column):
+        result = ColumnEmulator(data=(pd.to_datetime(column).dt.dayofweek + 1) % 7)
+        result.sf_type = ColumnType(LongType(), True)
+        return result
+
+    session = Session.builder.config("local_testing", True).create()
+    processed = pd.Timestamp("2024-01-01")
+    dates = pd.to_datetime(["1995-01-03", "1995-02-14", "1995-02-20", "1996-03-01", "1996-07-04", "1997-01-15"])
+    lines = pd.DataFrame({
+        "L_ORDERKEY": [1, 1, 2, 3, 4, 5, 5, 6], "L_PARTKEY": [1, 2, 1, 3, 2, 3, 1, 2],
+        "L_QUANTITY": [5.0, 3.0, 7.0, 1.0, 2.0, 4.0, 6.0, 8.0],
+        "L_EXTENDEDPRICE": [500.0, 300.0, 700.0, 100.0, 200.0, 400.0, 600.0, 800.0],
+        "L_DISCOUNT": [0.05, 0.0, 0.1, 0.0, 0.05, 0.0, 0.1, 0.0],
+        "L_LINENUMBER": [1, 2, 1, 1, 1, 1, 2, 1], "PROCESSED_TIMESTAMP": processed,
+    })
+    lines["L_TOTAL_AMOUNT"] = (lines["L_EXTENDEDPRICE"] * (1 - lines["L_DISCOUNT"])).round(2)
+    tables = {
+        "CUSTOMER_SILVER": pd.DataFrame({
+            "C_CUSTKEY": [1, 2, 3, 4], "C_NAME": [f"Customer#{key}" for key in range(1, 5)],
+            "C_NATION_NAME": ["VIETNAM", "JAPAN", "FRANCE", "VIETNAM"],
+            "C_REGION_NAME": ["ASIA", "ASIA", "EUROPE", "ASIA"],
+            "C_MKTSEGMENT": ["AUTO", "BUILDING", "AUTO", "BUILDING"], "PROCESSED_TIMESTAMP": processed,
+        }),
+        "ORDERS_SILVER": pd.DataFrame({
+            "O_ORDERKEY": range(1, 7), "O_CUSTKEY": [1, 2, 3, 4, 1, 2], "O_ORDERDATE": dates.date,
+            "O_ORDER_YEAR": dates.year, "O_ORDER_MONTH": dates.month, "O_ORDER_QUARTER": dates.quarter,
+            "LOAD_TIMESTAMP": processed, "PROCESSED_TIMESTAMP": processed,
+        }),
+        "LINEITEM_SILVER": lines,
+        "PART_SILVER": pd.DataFrame({
+            "P_PARTKEY": [1, 2, 3], "P_NAME": ["part 1", "part 2", "part 3"], "P_MFGR": "Manufacturer#1",
+            "P_BRAND": "Brand#11", "P_TYPE": ["SMALL", "LARGE", "SMALL"], "P_TYPE_CATEGORY": ["SMALL", "LARGE", "SMALL"],
+        }),
+    }
+    for table_name, frame in tables.items():
+        session.create_dataframe(frame).write.mode("overwrite").save_as_table(table_name)
+    yield session
+    session.close()
+
+
+def step_actions(pipeline, session, argv):
+    """
+    Run the real pipeline steps one after another and count the actions
+    (queries) each issues. Local testing records one query per action but not
+    the thread that issued it, so steps are not run through run_pipeline
+    """
+    results, actions = {}, {}
+    for step in pipeline.pipeline_steps(pipeline.parse_args(argv)):
+        dependencies = [results[dependency] for dependency in step["depends_on"]]
+        with session.query_history() as history:
+            results[step["name"]] = step["run"](session, *dependencies)
+        actions[step["name"]] = len(history.queries)
+    return actions
+
+
+def query(text):
+    return SimpleNamespace(sql_text=text, thread_id=0)
+
+
+def test_scan_row_counts_queries_reading_the_source(pipeline):
+    queries = [
+        query('CREATE TABLE CUSTOMER_RFM_SCORES AS SELECT * FROM "SNOWPARK_TEMP_TABLE_1" JOIN CUSTOMER_SILVER'),
+        query("SELECT COUNT(*) FROM CUSTOMER_RFM_SCORES"),
+    ]
+    row = pipeline.scan_row("RFM Segmentation", queries, 1, 1.0, "SNOWPARK_TEMP_TABLE_1",
+                            ("ORDERS_SILVER", "LINEITEM_SILVER"))
+    assert row["CUSTOMER_SILVER"] == 1
+    assert row["FACT_READS"] == 1
+    assert row["SCANS_AVOIDED"] == 2
+    assert row["SOURCE_QUERIES"] == 1
+    assert pipeline.query_budget_overruns([row]) == []
+
+
+def test_scan_row_counts_a_query_naming_the_fact_twice_once(pipeline):
+    queries = [query("CREATE TABLE CUSTOMER_RFM_SCORES AS SELECT * FROM (SELECT * FROM FACT) "
+                     "CROSS JOIN (SELECT APPROX_PERCENTILE(MONETARY, 0.2) FROM FACT)")]
+    row = pipeline.scan_row("RFM Segmentation", queries, 1, 1.0, "FACT", ("ORDERS_SILVER", "LINEITEM_SILVER"))
+    assert row["FACT_READS"] == 1
+    assert row["SCANS_AVOIDED"] == 2
+
+
+def test_budget_overrun_warns_without_failing(pipeline, capsys):
+    rows = [
+        {"STEP": "Sales Trends", "SOURCE_QUERIES": 4, "BUDGET": 3},
+        {"STEP": "Product Performance", "SOURCE_QUERIES": 1, "BUDGET": 1},
+    ]
+    assert pipeline.check_query_budget(rows) == rows[:1]
+    assert "Sales Trends 4/3" in capsys.readouterr().out
+
+
+def test_run_pipeline_attributes_queries_to_their_step(pipeline):
+    session = FakeSession()
+    fact_step = pipeline.FACT_STEP
+
+    def build_fact(session):
+        session.sql("CREATE TEMP TABLE FACT AS SELECT * FROM ORDERS_SILVER JOIN LINEITEM_SILVER")
+        return SimpleNamespace(table_name='DB.SCHEMA."FACT"')
+
+    def analysis(table_name, reads):
+        def run(session, fact):
+            for _ in range(reads):
+                session.sql("SELECT * FROM FACT")
+            session.sql(f"SELECT COUNT(*) FROM {table_name}")
+        return run
+
+    steps = [
+        {"name": fact_step, "run": build_fact, "depends_on": (), "replaces": (), "budget": 1},
+        {"name": "Within budget", "run": analysis("A_RESULTS", 1),
+         "depends_on": (fact_step,), "replaces": ("ORDERS_SILVER",), "budget": 1},
+        {"name": "Over budget", "run": analysis("B_RESULTS", 3),
+         "depends_on": (fact_step,), "replaces": ("ORDERS_SILVER",), "budget": 2},
+    ]
+    results, seconds, queries, _ = pipeline.run_pipeline(session, steps, max_workers=2)
+    rows = {row["STEP"]: row for row in pipeline.report_rows(steps, results, seconds, queries)}
+
+    assert rows[fact_step]["ORDERS_SILVER"] == 1
+    assert rows["Within budget"]["QUERIES"] == 2
+    assert rows["Within budget"]["FACT_READS"] == 1
+    assert rows["Over budget"]["SOURCE_QUERIES"] == 3
+    assert [row["STEP"] for row in pipeline.query_budget_overruns(rows.values())] == ["Over budget"]
+
+
+def test_incremental_watermark_is_read_before_the_fact(pipeline):
+    steps = {step["name"]: step for step in pipeline.pipeline_steps(pipeline.parse_args(["--incremental"]))}
+    assert steps[pipeline.FACT_STEP]["after"] == (pipeline.WATERMARK_STEP,)
+    assert pipeline.WATERMARK_STEP in steps["RFM Segmentation"]["depends_on"]
+
+    session, order = FakeSession(), []
+
+    def step(name):
+        def run(session, *dependencies):
+            order.append((name, dependencies))
+            return name
+        return run
+
+    pipeline.run_pipeline(session, [
+        {"name": "Fact", "run": step("Fact"), "depends_on": (), "after": ("Watermark",)},
+        {"name": "Watermark", "run": step("Watermark"), "depends_on": ()},
+        {"name": "RFM", "run": step("RFM"), "depends_on": ("Fact", "Watermark")},
+    ], max_workers=3)
+    assert order == [("Watermark", ()), ("Fact", ()), ("RFM", ("Fact", "Watermark"))]
+
+
+# Saved results, summaries shown and (incremental) watermark / MERGE statements
+FULL_RUN_ACTIONS = {
+    "Shared Order Fact": 1,     # cache_result
+    "RFM Segmentation": 4,      # save, count, 2 shows
+    "Sales Trends": 5,          # 2 saves, 3 shows
+    "Product Performance": 3,   # save, 2 shows
+    "Regional Performance": 2,  # save, show
+}
+
+
+def test_pipeline_steps_issue_their_actions(pipeline, local_session):
+    assert step_actions(pipeline, local_session, []) == FULL_RUN_ACTIONS
+
+
+def test_incremental_pipeline_steps_issue_their_actions(pipeline, local_session):
+    # First run: no watermark table yet (the failed read is not recorded),
+    # RFM values and order owners are saved in full
+    assert step_actions(pipeline, local_session, ["--incremental"]) == {
+        pipeline.WATERMARK_STEP: 1, **FULL_RUN_ACTIONS,
+        "RFM Segmentation": 7,  # 3 saves, count, 2 shows, watermark save
+    }
+    # Next run: the changed customers are merged into the saved values and owners
+    assert step_actions(pipeline, local_session, ["--incremental"]) == {
+        pipeline.WATERMARK_STEP: 1, **FULL_RUN_ACTIONS,
+        "RFM Segmentation": 8,  # watermark read, 2 merges, save, count, 2 shows, watermark save
+    }
+
+
+@pytest.mark.skipif(os.environ.get("TPCH_SNOWPARK_INTEGRATION") != "1",
+                    reason="set TPCH_SNOWPARK_INTEGRATION=1 to run the pipeline on Snowflake")
+def test_pipeline_stays_within_query_budget(pipeline):
+    session = pipeline.create_snowpark_session()
+    try:
+        steps = pipeline.pipeline_steps(pipeline.parse_args([]))
+        results, seconds, queries, _ = pipeline.run_pipeline(session, steps, max_workers=4)
+        rows = pipeline.report_rows(steps, results, seconds, queries)
+    finally:
+        session.close()
+    assert pipeline.query_budget_overruns(rows) == []
@@ -0,0 +1,121 @@
+"""
+Micro-benchmark cube trong RAM (mục 3.7 của dashboard) so với cách pandas.
+
+Với mỗi lựa chọn bộ lọc, đo thời gian (µs, trung vị) của ba thao tác trên
+trang Executive Summary:
+    kpi   - tổng doanh thu + tổng đơn hàng (MONTHLY_SALES_REPORT)
+    pie   - doanh thu theo vùng (REGIONAL_ANALYSIS)
+    trend - doanh thu theo (năm, tháng), sắp theo thời gian
+Cách pandas: lọc DataFrame bằng mặt nạ isin rồi sum/groupby/sort mỗi lượt
+chạy. Cách cube: ReportCube.total / ReportCube.by trên mảng NumPy dựng sẵn.
+Kết quả hai cách được so khớp trước khi đo. Thời gian dựng cube (một lần mỗi
+phiên bản dữ liệu) được in riêng.
+
+Dữ liệu sinh bằng benchmarks/make_local_data.py (cùng kích thước lưới thật).
+
+Chạy:
+    python benchmarks/bench_cube.py
+    python benchmarks/bench_cube.py --repeat 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import streamlit_dashboard_cloud as dashboard  # noqa: E402
+from make_local_data import make_monthly_sales, make_regional  # noqa: E402
+
+SELECTIONS = {
+    "không lọc": {},
+    "năm": {"year": [1995]},
+    "năm + quý": {"year": [1995, 1996], "quarter": [2, 3]},
+    "vùng + năm": {"region": ["ASIA", "EUROPE"], "year": [1996]},
+}
+
+def pandas_mask(df, table_name, selection):
+    """Mặt nạ lọc như cách cũ: mỗi cột của bảng một điều kiện isin"""
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in dashboard.table_filters(table_name, selection):
+        mask &= df[column].isin(values).to_numpy()
+    return mask
+
+def pandas_ops(monthly, regional, selection):
+    """Lọc + tính như một lượt chạy của cách cũ (mặt nạ được tính lại mỗi lượt)"""
+    sales = monthly[pandas_mask(monthly, "MONTHLY_SALES_REPORT", selection)]
+    regions = regional[pandas_mask(regional, "REGIONAL_ANALYSIS", selection)]
+    return {
+        "kpi": lambda: (sales["TOTAL_REVENUE"].sum(), sales["TOTAL_ORDERS"].sum()),
+        "pie": lambda: regions.groupby("REGION_NAME", observed=True)["TOTAL_REVENUE"].sum(),
+        "trend": lambda: sales.sort_values("REPORT_DATE")["TOTAL_REVENUE"],
+    }
+
+def cube_ops(sales_cube, regional_cube, selection):
+    return {
+        "kpi": lambda: (sales_cube.total("TOTAL_REVENUE", selection), sales_cube.total("TOTAL_ORDERS", selection)),
+        "pie": lambda: regional_cube.by("region", "TOTAL_REVENUE", selection),
+        "trend": lambda: sales_cube.by(("year", "month"), "TOTAL_REVENUE", selection),
+    }
+
+def time_us(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(float(np.median(samples)) * 1e6, 1)
+
+def check(pandas_result, cube_result, op):
+    """Hai cách phải cho cùng kết quả"""
+    if op == "kpi":
+        assert np.allclose(pandas_result, cube_result), op
+    else:
+        assert np.allclose(np.sort(pandas_result.to_numpy()), np.sort(cube_result["TOTAL_REVENUE"].to_numpy())), op
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=500, help="Số lần đo mỗi thao tác (lấy trung vị)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    generated_at = pd.Timestamp("2024-01-01 02:00:00")
+    # Giống snapshot thật: cột đã ép kiểu gọn (category, int32...)
+    monthly = dashboard.compact_dtypes(make_monthly_sales(rng, generated_at))
+    regional = dashboard.compact_dtypes(make_regional(rng, generated_at))
+
+    build = {}
+    cubes = {}
+    for table_name, df in [("MONTHLY_SALES_REPORT", monthly), ("REGIONAL_ANALYSIS", regional)]:
+        spec = dashboard.CUBE_SPECS[table_name]
+        start = time.perf_counter()
+        cubes[table_name] = dashboard.ReportCube(df, spec["dims"], spec["measures"])
+        build[table_name] = (time.perf_counter() - start) * 1000
+        print(f"✅ Dựng cube {table_name} ({len(df):,} dòng): {build[table_name]:,.1f} ms", file=sys.stderr)
+
+    rows = []
+    for name, choice in SELECTIONS.items():
+        selection = dashboard.normalize_filters(choice)
+        cube = cube_ops(cubes["MONTHLY_SALES_REPORT"], cubes["REGIONAL_ANALYSIS"], selection)
+        for op, cube_func in cube.items():
+            pandas_func = lambda: pandas_ops(monthly, regional, selection)[op]()  # noqa: E731
+            check(pandas_func(), cube_func(), op)
+            pandas_us = time_us(pandas_func, args.repeat)
+            cube_us = time_us(cube_func, args.repeat)
+            rows.append({
+                "SELECTION": name,
+                "OP": op,
+                "PANDAS_US": pandas_us,
+                "CUBE_US": cube_us,
+                "SPEEDUP": round(pandas_us / cube_us, 1) if cube_us else None,
+            })
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
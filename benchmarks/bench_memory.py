@@ -0,0 +1,83 @@
+"""
+Báo cáo bộ nhớ các bảng gold: cách tải cũ (SELECT * + to_pandas) so với
+đường tải gọn của dashboard (fetch_table compact=True: chỉ chọn cột trong
+TABLE_COLUMNS, ép kiểu từng Arrow batch).
+
+Mỗi process Streamlit giữ một bản sao cho mỗi frame được cache, nên MB_AFTER
+là phần RAM mỗi replica phải giữ cho một bảng. Báo cáo kéo toàn bộ từng bảng
+hai lần (kể cả CUSTOMER_METRICS), vì vậy chỉ chạy ở đây, không chạy trong
+process phục vụ người dùng.
+
+Backend:
+    local     - file Parquet trong --data-dir (mặc định: sinh dữ liệu mẫu tạm
+                bằng benchmarks/make_local_data.py)
+    snowflake - kết nối như dashboard (Streamlit Secrets / config.json)
+
+Chạy:
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --data-dir local_data
+    python benchmarks/bench_memory.py --backend snowflake --tables CUSTOMER_METRICS
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def memory_report(dashboard, session, table_names):
+    """Bộ nhớ (deep) của từng bảng theo cách tải cũ và đường tải gọn"""
+    rows = []
+    for table_name in table_names:
+        before = dashboard.fetch_table(session, table_name, compact=False)
+        after = dashboard.fetch_table(session, table_name, compact=True)
+        before_mb = before.memory_usage(deep=True).sum() / 1024**2
+        after_mb = after.memory_usage(deep=True).sum() / 1024**2
+        rows.append({
+            "TABLE": table_name,
+            "ROWS": len(after),
+            "COLUMNS_BEFORE": before.shape[1],
+            "COLUMNS_AFTER": after.shape[1],
+            "MB_BEFORE": round(before_mb, 2),
+            "MB_AFTER": round(after_mb, 2),
+            "SAVED_PCT": round(100 * (1 - after_mb / before_mb), 1) if before_mb else 0.0,
+        })
+        print(f"✅ {table_name}: {before_mb:,.1f} MB -> {after_mb:,.1f} MB", file=sys.stderr)
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["local", "snowflake"], default="local", help="Nguồn dữ liệu")
+    parser.add_argument("--data-dir", help="Thư mục Parquet có sẵn (backend local)")
+    parser.add_argument("--customers", type=int, default=150_000, help="Số khách hàng khi sinh dữ liệu mẫu")
+    parser.add_argument("--tables", nargs="+", help="Chỉ đo các bảng này (mặc định: mọi bảng gold)")
+    args = parser.parse_args()
+
+    os.environ["TPCH_DASHBOARD_BACKEND"] = args.backend
+    if args.backend == "local":
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(tempfile.mkdtemp(prefix="tpch_memory_"), "data")
+            subprocess.run([
+                sys.executable, os.path.join(ROOT, "benchmarks", "make_local_data.py"),
+                "--out", data_dir, "--customers", str(args.customers),
+            ], check=True, stdout=subprocess.DEVNULL)
+        os.environ["TPCH_DASHBOARD_LOCAL_DIR"] = data_dir
+
+    # Import sau khi đặt biến môi trường: dashboard đọc backend lúc import
+    sys.path.insert(0, ROOT)
+    import streamlit_dashboard_cloud as dashboard
+
+    session, _ = dashboard.create_session()
+    try:
+        report = memory_report(dashboard, session, args.tables or list(dashboard.TABLE_COLUMNS))
+    finally:
+        session.close()
+    print(report.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
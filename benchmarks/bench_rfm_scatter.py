@@ -0,0 +1,137 @@
+"""
+Benchmark biểu đồ RFM trên trang Customer Analytics.
+
+So sánh payload gửi xuống trình duyệt và thời gian dựng figure ở 10k, 100k và
+1M khách hàng cho các chế độ:
+    svg_head1000     - cách cũ: px.scatter SVG trên 1000 dòng đầu
+    svg_full         - px.scatter SVG trên toàn bộ khách (để thấy giới hạn)
+    webgl_stratified - build_rfm_scatter trên mẫu phân tầng theo RFM_SEGMENT
+    density          - build_rfm_density trên lưới mật độ tính sẵn
+
+Dữ liệu được sinh ngẫu nhiên; phần lấy mẫu và chia lưới giả lập đúng những gì
+Snowflake trả về (sample_by / density_2d trong load_aggregate).
+
+Thời gian render trên trình duyệt: thêm --html-dir, mở từng file HTML được sinh
+ra; thời gian từ lúc tải trang tới frame đầu tiên sau khi vẽ được ghi vào
+tiêu đề trang và console.
+
+Chạy:
+    python benchmarks/bench_rfm_scatter.py
+    python benchmarks/bench_rfm_scatter.py --sizes 10000 100000 --html-dir bench_html
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import streamlit_dashboard_cloud as dashboard  # noqa: E402
+
+SEGMENTS = ["Champion", "Loyal", "Promising", "At Risk", "Lost", "Need Attention"]
+# Phân bố lệch giống dữ liệu thật: nhóm nhỏ dễ bị mất khi lấy head(1000)
+SEGMENT_WEIGHTS = [0.05, 0.15, 0.10, 0.20, 0.35, 0.15]
+
+BROWSER_TIMER = """
+var renderMs = performance.now();
+requestAnimationFrame(function () {
+    renderMs = performance.now();
+    document.title = "render_ms=" + renderMs.toFixed(0);
+    console.log(document.title);
+});
+"""
+
+def make_customers(n, seed=0):
+    """Sinh n khách hàng giả với các cột mà biểu đồ RFM dùng"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "C_NAME": [f"Customer#{i:09d}" for i in range(n)],
+        "RECENCY_DAYS": rng.integers(0, 2500, n),
+        "FREQUENCY": rng.integers(1, 40, n),
+        "MONETARY": rng.gamma(2.0, 50_000, n),
+        "RFM_SEGMENT": rng.choice(SEGMENTS, n, p=SEGMENT_WEIGHTS),
+    })
+
+def stratified_sample(customers, per_segment):
+    """Giả lập stat.sample_by với tỷ lệ n / kích thước nhóm"""
+    sizes = customers["RFM_SEGMENT"].value_counts()
+    fractions = (per_segment / sizes).clip(upper=1.0)
+    keep = np.random.default_rng(1).random(len(customers)) < customers["RFM_SEGMENT"].map(fractions).to_numpy()
+    return customers[keep]
+
+def density_grid(customers, bins):
+    """Giả lập kết quả density_2d: X_BIN, Y_BIN, ROW_COUNT + biên lưới"""
+    x, y = customers["RECENCY_DAYS"].to_numpy(float), customers["MONETARY"].to_numpy(float)
+    x_step = (x.max() - x.min()) / bins or 1.0
+    y_step = (y.max() - y.min()) / bins or 1.0
+    cells = pd.DataFrame({
+        "X_BIN": np.minimum((x - x.min()) // x_step, bins - 1).astype(int),
+        "Y_BIN": np.minimum((y - y.min()) // y_step, bins - 1).astype(int),
+    })
+    grid = cells.value_counts().rename("ROW_COUNT").reset_index()
+    return grid.assign(X_MIN=x.min(), X_STEP=x_step, Y_MIN=y.min(), Y_STEP=y_step)
+
+def svg_scatter(frame):
+    return px.scatter(
+        frame, x="RECENCY_DAYS", y="MONETARY", color="RFM_SEGMENT",
+        size="FREQUENCY", hover_data=["C_NAME"], render_mode="svg",
+    )
+
+def _mark_count(trace):
+    """Số điểm (scatter) hoặc số ô (heatmap) mà trình duyệt phải vẽ"""
+    if getattr(trace, "z", None) is not None:
+        return int(np.size(trace.z))
+    return len(trace.x) if trace.x is not None else 0
+
+def measure(mode, n, build, html_dir=None):
+    """Đo thời gian dựng figure, serialize JSON và kích thước payload"""
+    start = time.perf_counter()
+    fig = build()
+    built = time.perf_counter()
+    payload = fig.to_json()
+    serialized = time.perf_counter()
+
+    if html_dir:
+        os.makedirs(html_dir, exist_ok=True)
+        fig.write_html(
+            os.path.join(html_dir, f"{mode}_{n}.html"),
+            include_plotlyjs="cdn", post_script=BROWSER_TIMER,
+        )
+
+    return {
+        "MODE": mode,
+        "CUSTOMERS": n,
+        "MARKS": sum(_mark_count(trace) for trace in fig.data),
+        "BUILD_MS": round((built - start) * 1000, 1),
+        "SERIALIZE_MS": round((serialized - built) * 1000, 1),
+        "PAYLOAD_KB": round(len(payload.encode()) / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--html-dir", help="Ghi HTML từng figure để đo thời gian render trên trình duyệt")
+    args = parser.parse_args()
+
+    rows = []
+    for n in args.sizes:
+        customers = make_customers(n)
+        sample = stratified_sample(customers, dashboard.RFM_SAMPLE_PER_SEGMENT)
+        grid = density_grid(customers, dashboard.RFM_DENSITY_BINS)
+
+        rows.append(measure("svg_head1000", n, lambda: svg_scatter(customers.head(1000)), args.html_dir))
+        rows.append(measure("svg_full", n, lambda: svg_scatter(customers), args.html_dir))
+        rows.append(measure("webgl_stratified", n, lambda: dashboard.build_rfm_scatter(sample), args.html_dir))
+        rows.append(measure(
+            "density", n, lambda: dashboard.build_rfm_density(grid, dashboard.RFM_DENSITY_BINS), args.html_dir
+        ))
+        print(f"✅ {n:,} khách hàng xong", file=sys.stderr)
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark khởi động nguội (cold start) của dashboard.
+
+Mỗi lần đo chạy trong một process Python mới (cache import trống) và đo:
+    IMPORT_MS        - thời gian import module dashboard (không tính streamlit)
+    FIRST_PAINT_MS   - từ lúc script bắt đầu tới khi sidebar được vẽ
+    FIRST_CONTENT_MS - tới phần tử đầu tiên của trang sau sidebar
+                       (khung trang khi đang kết nối, hoặc tiêu đề trang)
+    DONE_MS          - tới khi cả trang vẽ xong
+    SNOWPARK/PLOTLY_AT_PAINT - gói nặng đã được import lúc sidebar hiện chưa
+
+Dashboard chạy headless qua Streamlit AppTest với backend local (Parquet, xem
+benchmarks/make_local_data.py). Để giống backend Snowflake, lần đọc Parquet
+đầu tiên (lúc mở session) được bọc thêm import Snowpark và --login-delay giây
+chờ, giả lập import Snowpark + đăng nhập trong create_session.
+
+--baseline REF đo thêm phiên bản streamlit_dashboard_cloud.py ở commit REF
+(cần có backend local, tức từ khi có benchmarks/make_local_data.py) để so
+sánh trước/sau.
+
+Chạy:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --baseline HEAD~1 --login-delay 2 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "streamlit_dashboard_cloud.py")
+
+HEAVY_MODULES = {"SNOWPARK": "snowflake.snowpark", "PLOTLY": "plotly.express"}
+
+def measure_import(app):
+    """(Process con) thời gian import module dashboard và các gói nặng đã được nạp"""
+    import importlib.util
+
+    import streamlit  # noqa: F401 - không tính vào thời gian của dashboard
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("dashboard_under_test", app)
+    spec.loader.exec_module(importlib.util.module_from_spec(spec))
+    return {
+        "IMPORT_MS": round((time.perf_counter() - start) * 1000, 1),
+        **{f"{key}_IMPORTED": module in sys.modules for key, module in HEAVY_MODULES.items()},
+    }
+
+def measure_first_paint(app, login_delay, timeout):
+    """(Process con) mốc thời gian các phần tử đầu tiên trong một lượt chạy AppTest"""
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    from streamlit.testing.v1 import AppTest
+
+    read_parquet = pd.read_parquet
+    logged_in = []
+
+    def slow_first_read(*args, **kwargs):
+        if not logged_in:
+            logged_in.append(True)
+            import snowflake.snowpark  # noqa: F401 - giả lập create_session thật
+            time.sleep(login_delay)
+        return read_parquet(*args, **kwargs)
+
+    pd.read_parquet = slow_first_read
+
+    marks = {}
+    enqueue = ForwardMsgQueue.enqueue
+
+    def timed_enqueue(self, msg):
+        if msg.HasField("delta"):
+            now = time.perf_counter()
+            root = msg.metadata.delta_path[0] if msg.metadata.delta_path else 0
+            if root == 1 and "sidebar" not in marks:
+                marks["sidebar"] = now
+                marks["heavy"] = {key: module in sys.modules for key, module in HEAVY_MODULES.items()}
+            elif root == 0 and "sidebar" in marks and "content" not in marks:
+                marks["content"] = now
+        enqueue(self, msg)
+
+    ForwardMsgQueue.enqueue = timed_enqueue
+
+    at = AppTest.from_file(app, default_timeout=timeout)
+    start = time.perf_counter()
+    at.run()
+    done = time.perf_counter()
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    def ms(mark):
+        return round((marks[mark] - start) * 1000, 1) if mark in marks else None
+
+    return {
+        "FIRST_PAINT_MS": ms("sidebar"),
+        "FIRST_CONTENT_MS": ms("content"),
+        "DONE_MS": round((done - start) * 1000, 1),
+        **{f"{key}_AT_PAINT": loaded for key, loaded in marks.get("heavy", {}).items()},
+    }
+
+def run_child(app, measure, args, env):
+    """Chạy một lần đo (import/paint) trong process mới, trả về dict kết quả"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", app, "--measure", measure,
+               "--login-delay", str(args.login_delay), "--timeout", str(args.timeout)]
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "process con lỗi")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def baseline_app(ref, workdir):
+    """Ghi streamlit_dashboard_cloud.py ở commit ref ra file tạm"""
+    source = subprocess.run(
+        ["git", "show", f"{ref}:streamlit_dashboard_cloud.py"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    path = os.path.join(workdir, "streamlit_dashboard_baseline.py")
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="Commit để so sánh (vd. HEAD~1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi phiên bản (lấy trung vị)")
+    parser.add_argument("--login-delay", type=float, default=1.0, help="Giây giả lập đăng nhập Snowflake")
+    parser.add_argument("--data-dir", help="Thư mục Parquet có sẵn (mặc định: sinh dữ liệu mẫu tạm)")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout mỗi lượt chạy (giây)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", choices=["import", "paint"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.measure == "import":
+            result = measure_import(args.child)
+        else:
+            result = measure_first_paint(args.child, args.login_delay, args.timeout)
+        print(json.dumps(result))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="tpch_startup_")
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(workdir, "data")
+        subprocess.run([
+            sys.executable, os.path.join(ROOT, "benchmarks", "make_local_data.py"),
+            "--out", data_dir, "--customers", "20000", "--products", "5000",
+        ], check=True, stdout=subprocess.DEVNULL)
+
+    variants = {"current": APP}
+    if args.baseline:
+        variants[f"baseline ({args.baseline})"] = baseline_app(args.baseline, workdir)
+
+    rows = []
+    for name, app in variants.items():
+        runs = []
+        for i in range(args.repeat):
+            env = {
+                **os.environ,
+                "TPCH_DASHBOARD_BACKEND": "local",
+                "TPCH_DASHBOARD_LOCAL_DIR": data_dir,
+                # Cache đĩa trống mỗi lần: đo đúng lần mở đầu tiên của một pod mới
+                "TPCH_DASHBOARD_CACHE_DIR": os.path.join(workdir, f"cache_{len(rows)}_{i}"),
+            }
+            runs.append({**run_child(app, "import", args, env), **run_child(app, "paint", args, env)})
+        frame = pd.DataFrame(runs)
+        row = {"VERSION": name}
+        for column in frame.columns:
+            if frame[column].dtype == bool:
+                row[column] = bool(frame[column].all())
+            else:
+                row[column] = round(float(frame[column].median()), 1)
+        rows.append(row)
+        print(f"✅ {name}: sidebar sau {row['FIRST_PAINT_MS']:,.0f} ms, "
+              f"trang xong sau {row['DONE_MS']:,.0f} ms", file=sys.stderr)
+
+    print(pd.DataFrame(rows).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Load test dashboard với N người dùng đồng thời (headless, Streamlit AppTest).
+
+Mỗi người dùng ảo là một AppTest riêng (session_state riêng), chạy trong
+thread của cùng một process, nên dùng chung cache st.cache_data /
+cache_resource, pool session và snapshot store như một replica thật. Kịch
+bản mỗi vòng: mở lần lượt 4 trang và đổi các bộ lọc (năm, tìm khách hàng,
+trang tiếp theo, chế độ RFM, chỉ số sản phẩm).
+
+AppTest gán Runtime toàn cục trong mỗi lượt chạy nên không chạy song song
+được: các lượt rerun xếp hàng qua một lock. Thời gian đo gồm cả thời gian
+chờ lock, tương tự các script run tranh nhau GIL trên một replica thật
+(backend local chủ yếu tốn CPU).
+
+Dữ liệu đến từ backend local (Parquet, xem benchmarks/make_local_data.py),
+không cần tài khoản Snowflake. Với mỗi mức N, script báo cáo:
+    P50/P95/P99_MS   - thời gian mỗi lượt rerun (một thao tác của người dùng)
+    THROUGHPUT       - số rerun/giây của cả replica
+    PEAK_RSS_MB      - RSS cao nhất của process trong lúc chạy mức đó
+    DATA/FIGURE/DISK_HIT_PCT - tỷ lệ hit của từng lớp cache trong mức đó
+(lấy từ log JSON của logger tpch_dashboard.perf)
+
+Mặc định cache được xoá trước mỗi mức để các mức so sánh được với nhau;
+--keep-warm giữ cache giữa các mức (trạng thái ổn định của replica).
+
+Chạy:
+    python benchmarks/load_test.py --users 1 5 10 20 --rounds 3
+    python benchmarks/load_test.py --users 10 --data-dir local_data --keep-warm
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "streamlit_dashboard_cloud.py")
+
+RUN_LOCK = threading.Lock()
+
+PAGES = ["🏠 Executive Summary", "📈 Sales Analysis", "👥 Customer Analytics", "📦 Product Performance"]
+
+class PerfCollector(logging.Handler):
+    """Thu các dòng log JSON của dashboard (logger tpch_dashboard.perf)"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(json.loads(record.getMessage()))
+
+    def runs(self):
+        with self._lock:
+            return [r for r in self.records if r["event"] == "run"]
+
+class RssSampler(threading.Thread):
+    """Lấy mẫu RSS của process định kỳ để biết đỉnh trong từng mức N"""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = 0
+        self._done = threading.Event()
+
+    @staticmethod
+    def current_kb():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Không có /proc: đỉnh từ lúc khởi động
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak_kb = max(self.peak_kb, self.current_kb())
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return max(self.peak_kb, self.current_kb())
+
+def simulate_user(user_id, rounds, timeout, latencies, errors):
+    """Một người dùng: mở từng trang và đổi bộ lọc, đo thời gian từng rerun"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=timeout)
+
+    def step(action, interact):
+        start = time.perf_counter()
+        with RUN_LOCK:
+            interact()
+        latencies.append((action, time.perf_counter() - start))
+        if at.exception:
+            errors.append((user_id, action, at.exception[0].value))
+
+    try:
+        _scenario(at, step, user_id, rounds)
+    except Exception as e:
+        errors.append((user_id, "kịch bản", repr(e)))
+
+def _scenario(at, step, user_id, rounds):
+    step("open", at.run)
+    for round_no in range(rounds):
+        for page in PAGES:
+            step(page, lambda: at.sidebar.radio[0].set_value(page).run())
+            if page == "📈 Sales Analysis":
+                years = at.selectbox[0].options
+                year = years[(user_id + round_no) % len(years)]
+                step("đổi năm", lambda: at.selectbox[0].set_value(year).run())
+            elif page == "👥 Customer Analytics":
+                prefix = f"Customer#00000{(user_id + round_no) % 10}"
+                step("tìm khách", lambda: at.text_input[0].set_value(prefix).run())
+                step("trang sau", lambda: at.number_input[0].increment().run())
+                mode = at.radio[0].options[(user_id + round_no) % 2]
+                step("chế độ RFM", lambda: at.radio[0].set_value(mode).run())
+            elif page == "📦 Product Performance":
+                metric = at.radio[0].options[(user_id + round_no) % 2]
+                step("đổi chỉ số", lambda: at.radio[0].set_value(metric).run())
+
+def hit_pct(hits, misses):
+    total = hits + misses
+    return round(100 * hits / total, 1) if total else None
+
+def run_level(users, rounds, timeout, collector, before):
+    """
+    Chạy một mức N người dùng đồng thời, trả về một dòng kết quả.
+    before: bộ đếm cache trước mức này (None nếu cache vừa được xoá).
+    """
+    latencies, errors = [], []
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=simulate_user, args=(i, rounds, timeout, latencies, errors))
+        for i in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    peak_kb = sampler.stop()
+
+    after = collector.runs()[-1]["caches"]
+    delta = {key: value - (before or {}).get(key, 0) for key, value in after.items()}
+    ms = np.array([seconds for _, seconds in latencies]) * 1000
+    return {
+        "USERS": users,
+        "RERUNS": len(ms),
+        "P50_MS": round(float(np.percentile(ms, 50)), 1),
+        "P95_MS": round(float(np.percentile(ms, 95)), 1),
+        "P99_MS": round(float(np.percentile(ms, 99)), 1),
+        "THROUGHPUT": round(len(ms) / elapsed, 2),
+        "PEAK_RSS_MB": round(peak_kb / 1024, 1),
+        "DATA_HIT_PCT": hit_pct(delta["data_calls"] - delta["data_misses"], delta["data_misses"]),
+        "FIGURE_HIT_PCT": hit_pct(delta["figure_hits"], delta["figure_misses"]),
+        "DISK_HIT_PCT": hit_pct(delta["disk_hits"], delta["disk_misses"]),
+        "ERRORS": len(errors),
+    }, errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 5, 10, 20], help="Các mức số người dùng đồng thời")
+    parser.add_argument("--rounds", type=int, default=2, help="Số vòng kịch bản mỗi người dùng")
+    parser.add_argument("--data-dir", help="Thư mục Parquet có sẵn (mặc định: sinh dữ liệu mẫu tạm)")
+    parser.add_argument("--customers", type=int, default=50_000, help="Số khách hàng khi sinh dữ liệu mẫu")
+    parser.add_argument("--keep-warm", action="store_true", help="Không xoá cache giữa các mức")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout mỗi rerun (giây)")
+    parser.add_argument("--csv", help="Ghi kết quả ra file CSV")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tpch_load_test_")
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(workdir, "data")
+        subprocess.run([
+            sys.executable, os.path.join(ROOT, "benchmarks", "make_local_data.py"),
+            "--out", data_dir, "--customers", str(args.customers),
+        ], check=True)
+
+    os.environ.update({
+        "TPCH_DASHBOARD_BACKEND": "local",
+        "TPCH_DASHBOARD_LOCAL_DIR": data_dir,
+        "TPCH_DASHBOARD_CACHE_DIR": os.path.join(workdir, "cache"),
+        "TPCH_DASHBOARD_PERF": "1",
+        "TPCH_DASHBOARD_POOL_TIMEOUT": str(args.timeout),
+    })
+
+    import streamlit as st
+
+    # Gắn handler trước khi dashboard chạy: dashboard chỉ thêm handler in ra
+    # stderr khi logger chưa có handler nào
+    collector = PerfCollector()
+    perf_logger = logging.getLogger("tpch_dashboard.perf")
+    perf_logger.addHandler(collector)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+
+    rows = []
+    for users in args.users:
+        before = None
+        if args.keep_warm and collector.runs():
+            before = collector.runs()[-1]["caches"]
+        elif not args.keep_warm:
+            # Xoá cả cache_resource: bộ đếm hit/miss cũng về 0
+            st.cache_data.clear()
+            st.cache_resource.clear()
+        row, errors = run_level(users, args.rounds, args.timeout, collector, before)
+        rows.append(row)
+        print(f"✅ {users} người dùng: p95 {row['P95_MS']:,.0f} ms, {row['THROUGHPUT']} rerun/s, "
+              f"RSS đỉnh {row['PEAK_RSS_MB']:,.0f} MB, {row['ERRORS']} lỗi")
+        for user_id, action, message in errors[:5]:
+            print(f"   ⚠️ user {user_id} / {action}: {message}")
+
+    result = pd.DataFrame(rows)
+    print()
+    print(result.to_string(index=False))
+    if args.csv:
+        result.to_csv(args.csv, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Sinh dữ liệu mẫu cho backend local của dashboard.
+
+Ghi 4 bảng REPORTS (MONTHLY_SALES_REPORT, CUSTOMER_METRICS,
+PRODUCT_PERFORMANCE, REGIONAL_ANALYSIS) thành file Parquet, đúng tên cột và
+kiểu dữ liệu như các bảng gold trong PART 2. Dữ liệu sinh ngẫu nhiên với seed
+cố định nên mỗi lần chạy cho cùng một bộ dữ liệu (benchmark tất định).
+
+Chạy:
+    python benchmarks/make_local_data.py --out local_data --customers 150000
+    TPCH_DASHBOARD_BACKEND=local TPCH_DASHBOARD_LOCAL_DIR=local_data \\
+        streamlit run streamlit_dashboard_cloud.py
+"""
+
+import argparse
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+
+# Vùng và quốc gia theo TPC-H
+NATIONS = {
+    "AFRICA": ["ALGERIA", "ETHIOPIA", "KENYA", "MOROCCO", "MOZAMBIQUE"],
+    "AMERICA": ["ARGENTINA", "BRAZIL", "CANADA", "PERU", "UNITED STATES"],
+    "ASIA": ["INDIA", "INDONESIA", "JAPAN", "CHINA", "VIETNAM"],
+    "EUROPE": ["FRANCE", "GERMANY", "ROMANIA", "RUSSIA", "UNITED KINGDOM"],
+    "MIDDLE EAST": ["EGYPT", "IRAN", "IRAQ", "JORDAN", "SAUDI ARABIA"],
+}
+MKT_SEGMENTS = ["AUTOMOBILE", "BUILDING", "FURNITURE", "HOUSEHOLD", "MACHINERY"]
+SEGMENTS = ["Champion", "Loyal", "Promising", "At Risk", "Lost", "Need Attention"]
+SEGMENT_WEIGHTS = [0.05, 0.15, 0.10, 0.20, 0.35, 0.15]
+FIRST_DATE = dt.date(1992, 1, 1)
+LAST_DATE = dt.date(1998, 8, 2)
+
+def make_monthly_sales(rng, generated_at):
+    months = pd.date_range(FIRST_DATE, LAST_DATE, freq="MS")
+    revenue = rng.normal(2.8e9, 1.5e8, len(months)).round(2)
+    orders = rng.integers(18_000, 20_000, len(months))
+    growth = np.concatenate([[np.nan], np.diff(revenue) / revenue[:-1] * 100]).round(2)
+    yoy = pd.Series(revenue).pct_change(12).mul(100).round(2).to_numpy()
+    return pd.DataFrame({
+        "REPORT_DATE": months.date,
+        "YEAR": months.year.astype("int64"),
+        "MONTH": months.month.astype("int64"),
+        "QUARTER": months.quarter.astype("int64"),
+        "MONTH_NAME": months.strftime("%B"),
+        "TOTAL_ORDERS": orders.astype("int64"),
+        "TOTAL_REVENUE": revenue,
+        "AVG_ORDER_VALUE": (revenue / orders).round(2),
+        "TOTAL_ITEMS_SOLD": rng.normal(1.9e6, 1e5, len(months)).round(2),
+        "TOTAL_CUSTOMERS": rng.integers(15_000, 17_000, len(months)).astype("int64"),
+        "MOM_REVENUE_GROWTH": growth,
+        "YOY_REVENUE_GROWTH": yoy,
+        "GENERATED_AT": generated_at,
+    })
+
+def make_customers(rng, n, generated_at):
+    regions = np.array(list(NATIONS))
+    region = rng.choice(regions, n)
+    nation = np.array([NATIONS[r][i] for r, i in zip(region, rng.integers(0, 5, n))])
+    frequency = rng.integers(1, 40, n)
+    monetary = rng.gamma(2.0, 50_000, n).round(2)
+    recency = rng.integers(0, 2400, n)
+    last_order = pd.to_datetime(LAST_DATE) - pd.to_timedelta(recency, unit="D")
+    first_order = last_order - pd.to_timedelta(rng.integers(0, 2000, n), unit="D")
+    scores = rng.integers(1, 6, (n, 3))
+    return pd.DataFrame({
+        "C_CUSTKEY": np.arange(1, n + 1, dtype="int64"),
+        "C_NAME": [f"Customer#{i:09d}" for i in range(1, n + 1)],
+        "C_NATION": nation,
+        "C_REGION": region,
+        "C_MKTSEGMENT": rng.choice(MKT_SEGMENTS, n),
+        "RECENCY_DAYS": recency.astype("int64"),
+        "FREQUENCY": frequency.astype("int64"),
+        "MONETARY": monetary,
+        "R_SCORE": scores[:, 0].astype("int64"),
+        "F_SCORE": scores[:, 1].astype("int64"),
+        "M_SCORE": scores[:, 2].astype("int64"),
+        "RFM_SCORE": [f"{r}{f}{m}" for r, f, m in scores],
+        "RFM_SEGMENT": rng.choice(SEGMENTS, n, p=SEGMENT_WEIGHTS),
+        "FIRST_ORDER_DATE": first_order.date,
+        "LAST_ORDER_DATE": last_order.date,
+        "AVG_ORDER_VALUE": (monetary / frequency).round(2),
+        "LIFETIME_VALUE": monetary,
+        "GENERATED_AT": generated_at,
+    })
+
+def make_products(rng, n, generated_at):
+    quantity = rng.gamma(2.0, 150, n).round(2)
+    revenue = (quantity * rng.uniform(900, 2100, n)).round(2)
+    return pd.DataFrame({
+        "P_PARTKEY": np.arange(1, n + 1, dtype="int64"),
+        "P_NAME": [f"part {i}" for i in range(1, n + 1)],
+        "P_MFGR": [f"Manufacturer#{i}" for i in rng.integers(1, 6, n)],
+        "P_BRAND": [f"Brand#{m}{b}" for m, b in rng.integers(1, 6, (n, 2))],
+        "P_TYPE": rng.choice(["STANDARD POLISHED TIN", "SMALL PLATED COPPER", "LARGE BRUSHED BRASS",
+                              "ECONOMY ANODIZED STEEL", "PROMO BURNISHED NICKEL"], n),
+        "TOTAL_QUANTITY_SOLD": quantity,
+        "TOTAL_REVENUE": revenue,
+        "AVG_UNIT_PRICE": (revenue / quantity).round(2),
+        "AVG_DISCOUNT": rng.uniform(0, 0.1, n).round(4),
+        "TOTAL_ORDERS": rng.integers(1, 60, n).astype("int64"),
+        "REVENUE_RANK": pd.Series(revenue).rank(ascending=False, method="first").astype("int64").to_numpy(),
+        "QUANTITY_RANK": pd.Series(quantity).rank(ascending=False, method="first").astype("int64").to_numpy(),
+        "GENERATED_AT": generated_at,
+    })
+
+def make_regional(rng, generated_at):
+    rows = [
+        (region, nation, year, quarter)
+        for region, nations in NATIONS.items()
+        for nation in nations
+        for year in range(FIRST_DATE.year, LAST_DATE.year + 1)
+        for quarter in range(1, 5)
+    ]
+    df = pd.DataFrame(rows, columns=["REGION_NAME", "NATION_NAME", "YEAR", "QUARTER"]).astype({"YEAR": "int64", "QUARTER": "int64"})
+    n = len(df)
+    orders = rng.integers(2_000, 2_600, n)
+    revenue = rng.normal(3.4e8, 2e7, n).round(2)
+    return df.assign(
+        TOTAL_CUSTOMERS=rng.integers(5_000, 6_500, n).astype("int64"),
+        TOTAL_SUPPLIERS=rng.integers(350, 450, n).astype("int64"),
+        TOTAL_ORDERS=orders.astype("int64"),
+        TOTAL_REVENUE=revenue,
+        AVG_ORDER_VALUE=(revenue / orders).round(2),
+        MARKET_SHARE=(revenue / revenue.sum() * 100).round(4),
+        GENERATED_AT=generated_at,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="local_data", help="Thư mục ghi file Parquet")
+    parser.add_argument("--customers", type=int, default=150_000, help="Số dòng CUSTOMER_METRICS")
+    parser.add_argument("--products", type=int, default=200_000, help="Số dòng PRODUCT_PERFORMANCE")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    generated_at = pd.Timestamp("2024-01-01 02:00:00")
+    tables = {
+        "MONTHLY_SALES_REPORT": make_monthly_sales(rng, generated_at),
+        "CUSTOMER_METRICS": make_customers(rng, args.customers, generated_at),
+        "PRODUCT_PERFORMANCE": make_products(rng, args.products, generated_at),
+        "REGIONAL_ANALYSIS": make_regional(rng, generated_at),
+    }
+    os.makedirs(args.out, exist_ok=True)
+    for table_name, df in tables.items():
+        path = os.path.join(args.out, f"{table_name}.parquet")
+        df.to_parquet(path, index=False)
+        print(f"✅ {table_name}: {len(df):,} dòng -> {path}")
+
+if __name__ == "__main__":
+    main()
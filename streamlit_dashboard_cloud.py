@@ -1,13 +1,26 @@
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import numpy as np
 import pandas as pd
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col, sum as sum_, avg, count
+from pandas.api.types import union_categoricals
+import pyarrow.feather as feather
 import os
 import json
+import functools
+import gzip
+import logging
+import glob
+import math
+import queue
+import tempfile
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from types import SimpleNamespace
+from typing import Protocol
 
 # =============================================================================
 # 1. CẤU HÌNH TRANG & CSS
@@ -36,18 +49,30 @@ st.markdown("""
 # 2. KẾT NỐI SNOWFLAKE (Hỗ trợ cả Cloud và Local)
 # =============================================================================
 
-@st.cache_resource
+# Backend dữ liệu: "snowflake" (mặc định) hoặc "local" - đọc 4 bảng REPORTS từ
+# file Parquet trong TPCH_DASHBOARD_LOCAL_DIR (xem mục 3.6 và
+# benchmarks/make_local_data.py), không cần tài khoản Snowflake.
+DATA_BACKEND = os.environ.get("TPCH_DASHBOARD_BACKEND", "snowflake").lower()
+LOCAL_DATA_DIR = os.environ.get("TPCH_DASHBOARD_LOCAL_DIR", "local_data")
+
 def create_session():
     """
-    Tạo session kết nối.
+    Tạo session kết nối mới, trả về (session, nguồn cấu hình).
+    Backend local: LocalSession đọc Parquet, dữ liệu qua LocalBackend (bỏ qua các bước dưới)
     Ưu tiên 1: Streamlit Secrets (Chạy trên Cloud)
     Ưu tiên 2: config.json (Chạy Local)
     Ưu tiên 3: Active Session (Chạy trên Snowflake Native App)
     """
+    if DATA_BACKEND == "local":
+        return LocalSession.from_parquet(LOCAL_DATA_DIR), "local"
+
+    # Import Snowpark tại đây (không ở đầu file): gói nặng, chỉ cần khi mở session
+    from snowflake.snowpark import Session
+
     # CÁCH 1: Đọc từ Streamlit Secrets (Dành cho Streamlit Cloud)
     if hasattr(st, "secrets") and "snowflake" in st.secrets:
         try:
-            return Session.builder.configs(st.secrets["snowflake"]).create()
+            return Session.builder.configs(st.secrets["snowflake"]).create(), "secrets"
         except Exception as e:
             st.error(f"❌ Lỗi kết nối từ Secrets: {e}")
             raise e
@@ -56,7 +81,7 @@ def create_session():
     if os.path.exists("config.json"):
         try:
             with open("config.json", "r") as f:
-                return Session.builder.configs(json.load(f)).create()
+                return Session.builder.configs(json.load(f)).create(), "config"
         except Exception as e:
             st.error(f"❌ Lỗi đọc file config.json: {e}")
 
@@ -65,40 +90,1836 @@ def create_session():
         from snowflake.snowpark.context import get_active_session
         session = get_active_session()
         if session:
-            return session
+            return session, "active"
     except:
         pass
 
     # Nếu không cách nào hoạt động
     raise Exception("❌ Không tìm thấy cấu hình kết nối! Hãy cài đặt Secrets trên Streamlit Cloud hoặc tạo file config.json.")
 
+# -----------------------------------------------------------------------------
+# 2.1 SESSION POOL - Nhiều kết nối + giới hạn đồng thời
+# -----------------------------------------------------------------------------
+# Một session dùng chung khiến truy vấn của mọi người dùng xếp hàng sau nhau.
+# Pool giữ tối đa POOL_SIZE session (tạo khi cần), kiểm tra sức khoẻ session
+# để lâu không dùng, mở lại khi session hết hạn và gắn query tag theo
+# trang/người dùng. Semaphore giới hạn số request đồng thời: quá tải thì
+# người dùng nhận thông báo sau ACQUIRE_TIMEOUT giây thay vì chờ vô hạn.
+#
+# Active Session (SiS) không tạo thêm được: pool dùng chung đúng session đó
+# (Snowpark cho phép nhiều thread) và chỉ giới hạn số request đồng thời.
+# Backend local cũng dùng chung một LocalSession (một bản dữ liệu trong RAM).
+#
+# Khởi động nhanh: prewarm() mở session đầu tiên ở thread nền (import Snowpark
+# + đăng nhập) ngay khi script chạy, để sidebar và khung trang được vẽ ngay
+# thay vì chờ kết nối. Request đầu tiên đợi đúng session đang mở đó thay vì
+# đăng nhập lần thứ hai.
+
+POOL_SIZE = int(os.environ.get("TPCH_DASHBOARD_POOL_SIZE", "4"))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get("TPCH_DASHBOARD_POOL_TIMEOUT", "15"))
+POOL_HEALTH_CHECK_AFTER = 60  # giây không dùng trước khi phải kiểm tra lại
+
+# Nguồn chỉ có một session dùng chung cho mọi request
+SHARED_SOURCES = {"active", "local"}
+
+# Mã lỗi connector khi token/session hết hạn hoặc mất kết nối
+SESSION_EXPIRED_ERRNOS = {390111, 390112, 390114, 250001, 250002}
+
+class SessionPoolBusy(Exception):
+    """Không lấy được session trong thời gian chờ (quá nhiều request đồng thời)"""
+
+class SessionConnectError(Exception):
+    """Không mở được session mới từ bất kỳ nguồn cấu hình nào"""
+
+class SessionPool:
+    """Pool session Snowpark có giới hạn, dùng qua context manager session()"""
+
+    # Bắt lỗi qua pool.Busy / pool.ConnectError: pool sống qua các lượt chạy
+    # (cache_resource) còn class lỗi ở module được định nghĩa lại mỗi lượt
+    Busy = SessionPoolBusy
+    ConnectError = SessionConnectError
+
+    def __init__(self, factory, size=POOL_SIZE, acquire_timeout=POOL_ACQUIRE_TIMEOUT):
+        self._factory = factory
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self.source = None
+        self.shared = False
+        self.label = None
+        self._idle = queue.LifoQueue()
+        self._shared_session = None
+        self._warmup = None
+        self._lock = threading.Lock()
+        self._limiter = threading.BoundedSemaphore(self.size)
+        self.stats = {"created": 0, "reconnects": 0, "busy": 0, "in_use": 0}
+
+    @contextmanager
+    def session(self, tag=None):
+        """Mượn một session cho một request, luôn trả lại pool khi xong"""
+        if not self._limiter.acquire(timeout=self.acquire_timeout):
+            self._count("busy")
+            raise self.Busy(f"Tất cả {self.size} kết nối đang bận")
+        session = None
+        try:
+            session = self._checkout()
+            self._count("in_use")
+            if tag and not self.shared:
+                self._set_query_tag(session, tag)
+            yield session
+        except Exception as e:
+            if session is not None and self._is_expired(e):
+                self._count("in_use", -1)
+                self._discard(session)
+                session = None
+            raise
+        finally:
+            if session is not None:
+                self._count("in_use", -1)
+                self._checkin(session)
+            self._limiter.release()
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self.stats[key] += delta
+
+    @property
+    def connected(self):
+        """Đã mở được ít nhất một session (không còn phải chờ đăng nhập lần đầu)"""
+        return self.stats["created"] > 0
+
+    def prewarm(self):
+        """Mở session đầu tiên ở thread nền, một lần cho mỗi process"""
+        with self._lock:
+            if self._warmup is not None or self.stats["created"]:
+                return
+            self._warmup = threading.Event()
+
+        def _run():
+            try:
+                self._checkin(self._open())
+            except Exception:
+                # Request đầu tiên sẽ tự mở lại và báo lỗi cho người dùng
+                pass
+            finally:
+                self._warmup.set()
+
+        threading.Thread(target=_run, name="session-prewarm", daemon=True).start()
+
+    def _open(self):
+        try:
+            session, source = self._factory()
+        except Exception as e:
+            raise self.ConnectError(str(e)) from e
+        with self._lock:
+            self.stats["created"] += 1
+            if self.source is None:
+                self.source = source
+                self.label = self._describe(session)
+            if source in SHARED_SOURCES:
+                # Không tạo thêm được / không cần thêm: dùng chung một session cho mọi request
+                self.shared = True
+                self._shared_session = session
+        return session
+
+    def _checkout(self):
+        if self._warmup is not None:
+            # Session đầu tiên đang được mở ở nền: chờ nó thay vì đăng nhập thêm lần nữa
+            self._warmup.wait(self.acquire_timeout)
+        if self.shared:
+            with self._lock:
+                session = self._shared_session
+            if session is None:
+                session = self._open()
+            return session
+        try:
+            session, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        if time.time() - last_used > POOL_HEALTH_CHECK_AFTER and not self._healthy(session):
+            self._discard(session)
+            return self._open()
+        return session
+
+    def _checkin(self, session):
+        if not self.shared:
+            self._idle.put((session, time.time()))
+
+    def _discard(self, session):
+        """Đóng session hỏng/hết hạn; request sau sẽ mở session mới"""
+        self._count("reconnects")
+        if self.shared:
+            with self._lock:
+                self._shared_session = None
+            return
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _healthy(session):
+        try:
+            session.create_dataframe([[1]]).collect()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _is_expired(error):
+        errno = getattr(error, "errno", None)
+        return errno in SESSION_EXPIRED_ERRNOS or "session no longer exists" in str(error).lower()
+
+    @staticmethod
+    def _set_query_tag(session, tag):
+        # ALTER SESSION chỉ khi tag đổi (đổi trang/người dùng), không phải mỗi lần rerun
+        if getattr(session, "_dashboard_query_tag", None) == tag:
+            return
+        try:
+            session.query_tag = tag
+            session._dashboard_query_tag = tag
+        except Exception:
+            pass
+
+    @staticmethod
+    def _describe(session):
+        try:
+            return f"{session.get_current_database()}.{session.get_current_schema()}"
+        except Exception:
+            return None
+
+@st.cache_resource
+def get_session_pool():
+    """Pool dùng chung cho mọi người dùng trong process"""
+    return SessionPool(create_session)
+
+def query_tag(page):
+    """Query tag cho mọi truy vấn của một request: ứng dụng, trang, người dùng"""
+    ctx = get_script_run_ctx()
+    return json.dumps({
+        "app": "tpch_dashboard",
+        "page": page,
+        "user_session": ctx.session_id if ctx else None,
+    }, ensure_ascii=False)
+
+# -----------------------------------------------------------------------------
+# 2.2 FRAGMENT - Chạy lại riêng component sở hữu widget
+# -----------------------------------------------------------------------------
+# Component có widget riêng (chọn năm, radio chỉ số, bảng phân trang...) được
+# bọc bằng st.fragment: đổi widget chỉ chạy lại component đó, không chạy lại
+# main(), không mượn lại session cho cả trang và không gọi lại các dataset.
+# Session của lượt chạy toàn trang được giữ trong _run_state; khi fragment
+# chạy lại một mình, nó tự mượn session từ pool trong thời gian chạy.
+# TPCH_DASHBOARD_FRAGMENTS=0 tắt fragment để đo so sánh trước/sau.
+
+FRAGMENTS_ENABLED = os.environ.get("TPCH_DASHBOARD_FRAGMENTS", "1") != "0"
+RERUN_LATENCY_HISTORY = 50
+
+_run_state = threading.local()
+
+@contextmanager
+def page_session(page, scope="toàn trang"):
+    """Mượn session cho một lượt chạy (toàn trang hoặc một fragment chạy lại)"""
+    run = start_perf_run(page, scope)
+    start = time.perf_counter()
+    try:
+        with get_session_pool().session(tag=query_tag(page)) as session:
+            if run is not None:
+                run.record("session", "acquire", time.perf_counter() - start)
+            _run_state.session = session
+            try:
+                with watch_queries(session, run):
+                    yield session
+            finally:
+                _run_state.session = None
+    finally:
+        finish_perf_run(run)
+
+def record_rerun_latency(scope, seconds):
+    """Lưu thời gian một lượt chạy (toàn trang hoặc một fragment) vào session_state"""
+    history = st.session_state.setdefault("rerun_latency", [])
+    history.append((scope, seconds))
+    del history[:-RERUN_LATENCY_HISTORY]
+
+def component_fragment(func):
+    """
+    Bọc component nhận session làm tham số đầu tiên thành fragment.
+    Session truyền vào chỉ dùng trong lượt chạy toàn trang; khi fragment chạy
+    lại, session cũ đã trả về pool nên phải mượn session mới.
+    """
+    @functools.wraps(func)
+    def run(_session, *args, **kwargs):
+        session = getattr(_run_state, "session", None)
+        if session is not None:
+            with perf_span("render", func.__name__):
+                return func(session, *args, **kwargs)
+
+        pool = get_session_pool()
+        start = time.perf_counter()
+        try:
+            with page_session(st.session_state.get("page"), scope=func.__name__) as session:
+                with perf_span("render", func.__name__):
+                    return func(session, *args, **kwargs)
+        except pool.Busy:
+            st.warning("⏳ Đang có nhiều người dùng truy cập cùng lúc. Vui lòng thử lại sau giây lát.")
+        except pool.ConnectError as e:
+            st.error(f"❌ Lỗi kết nối: {e}")
+        finally:
+            record_rerun_latency(func.__name__, time.perf_counter() - start)
+
+    return st.fragment(run) if FRAGMENTS_ENABLED else run
+
+def show_rerun_latency():
+    """Trung vị thời gian chạy lại theo phạm vi (toàn trang / từng fragment)"""
+    history = st.session_state.get("rerun_latency", [])
+    if not history:
+        return
+    by_scope = {}
+    for scope, seconds in history:
+        by_scope.setdefault(scope, []).append(seconds)
+    with st.sidebar.expander("⚡ Thời gian chạy lại"):
+        st.caption("Fragment: bật" if FRAGMENTS_ENABLED else "Fragment: tắt (chạy lại toàn trang)")
+        for scope, samples in sorted(by_scope.items()):
+            median_ms = sorted(samples)[len(samples) // 2] * 1000
+            st.caption(f"{scope}: trung vị {median_ms:,.0f} ms · lần cuối {samples[-1] * 1000:,.0f} ms ({len(samples)} lượt)")
+
+# -----------------------------------------------------------------------------
+# 2.3 PERF - Đo thời gian từng lượt chạy (bật khi cần)
+# -----------------------------------------------------------------------------
+# Bật bằng TPCH_DASHBOARD_PERF=1 (mọi người dùng) hoặc ?perf=1 trên URL (một
+# người dùng). Mỗi lượt chạy ghi các span: mượn session, tải từng dataset
+# (số dòng, bytes, query id Snowflake) và hiển thị từng component. Span được
+# ghi ra log dạng JSON (logger tpch_dashboard.perf, mỗi dòng một span/lượt
+# chạy) để tính p50/p95 theo trang ở production, và hiện trong sidebar.
+
+PERF_ENABLED = os.environ.get("TPCH_DASHBOARD_PERF", "0") == "1"
+PERF_HISTORY_SIZE = 500
+
+perf_logger = logging.getLogger("tpch_dashboard.perf")
+if not perf_logger.handlers:
+    _perf_handler = logging.StreamHandler()
+    _perf_handler.setFormatter(logging.Formatter("%(message)s"))
+    perf_logger.addHandler(_perf_handler)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+
+class PerfRun:
+    """Các span của một lượt chạy; worker thread ghi vào qua record()/span()"""
+
+    def __init__(self, page, scope):
+        self.page = page
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.spans = []
+        self.queries = None  # QueryHistory của session trong lượt chạy
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, seconds, **fields):
+        with self._lock:
+            self.spans.append({"kind": kind, "name": name, "ms": round(seconds * 1000, 1), **fields})
+
+    @contextmanager
+    def span(self, kind, name):
+        """Đo một đoạn code; caller điền thêm rows/bytes vào dict được yield"""
+        fields = {}
+        seen = len(self.queries.queries) if self.queries is not None else 0
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            if self.queries is not None:
+                # Session có thể chạy truy vấn của thread khác cùng lúc
+                thread_id = threading.get_ident()
+                fields["query_ids"] = [
+                    q.query_id for q in self.queries.queries[seen:] if q.thread_id in (None, thread_id)
+                ]
+            self.record(kind, name, time.perf_counter() - start, **fields)
+
+@st.cache_resource
+def _perf_history():
+    """Thời gian các lượt chạy/span gần đây của process, để tính p50/p95"""
+    return {"runs": {}, "spans": {}, "lock": threading.Lock()}
+
+def perf_enabled():
+    return PERF_ENABLED or st.query_params.get("perf") == "1"
+
+def start_perf_run(page, scope):
+    run = PerfRun(page, scope) if perf_enabled() else None
+    _run_state.perf = run
+    return run
+
+def current_perf_run():
+    return getattr(_run_state, "perf", None)
+
+@contextmanager
+def watch_queries(session, run):
+    """Ghi query id mọi truy vấn của session trong lượt chạy (nếu đang đo)"""
+    if run is None:
+        yield
+        return
+    with session.query_history(include_thread_id=True) as history:
+        run.queries = history
+        yield
+
+@contextmanager
+def perf_span(kind, name):
+    """Span trong lượt chạy hiện tại; yield None khi không đo"""
+    run = current_perf_run()
+    if run is None:
+        yield None
+        return
+    with run.span(kind, name) as fields:
+        yield fields
+
+def describe_result(fields, result):
+    """Thêm số dòng/bytes của kết quả vào span"""
+    if fields is not None and isinstance(result, pd.DataFrame):
+        fields["rows"] = len(result)
+        fields["bytes"] = int(result.memory_usage(deep=True).sum())
+
+def finish_perf_run(run):
+    """Ghi log và lưu lịch sử của lượt chạy vừa xong"""
+    _run_state.perf = None
+    if run is None:
+        return
+    total_ms = round((time.perf_counter() - run.started) * 1000, 1)
+    ctx = get_script_run_ctx()
+    base = {"page": run.page, "scope": run.scope, "user_session": ctx.session_id if ctx else None}
+    for span in run.spans:
+        perf_logger.info(json.dumps({"event": "span", **base, **span}, ensure_ascii=False, default=str))
+    perf_logger.info(json.dumps({"event": "run", **base, "ms": total_ms, "caches": cache_counters()}, ensure_ascii=False))
+
+    history = _perf_history()
+    with history["lock"]:
+        runs = history["runs"].setdefault((run.page, run.scope), [])
+        runs.append(total_ms)
+        del runs[:-PERF_HISTORY_SIZE]
+        for span in run.spans:
+            samples = history["spans"].setdefault((span["kind"], span["name"]), [])
+            samples.append(span["ms"])
+            del samples[:-PERF_HISTORY_SIZE]
+
+def cache_counters():
+    """Bộ đếm cộng dồn của các cache trong process, ghi kèm mỗi lượt chạy"""
+    data_calls, data_misses = data_cache_totals()
+    figures = get_figure_cache().stats
+    disk = _disk_cache_stats()
+    return {
+        "data_calls": data_calls, "data_misses": data_misses,
+        "figure_hits": figures["hits"], "figure_misses": figures["misses"],
+        "disk_hits": disk["hits"], "disk_misses": disk["misses"],
+    }
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _percentile_rows(groups, labels):
+    return pd.DataFrame([
+        {**dict(zip(labels, key)), "N": len(samples), "P50_MS": _percentile(samples, 0.5), "P95_MS": _percentile(samples, 0.95)}
+        for key, samples in sorted(groups.items())
+    ])
+
+def show_perf_panel():
+    """Span của lượt chạy hiện tại và p50/p95 theo trang trong sidebar"""
+    run = current_perf_run()
+    if run is None:
+        return
+    history = _perf_history()
+    with history["lock"]:
+        runs = {key: list(samples) for key, samples in history["runs"].items()}
+        spans = {key: list(samples) for key, samples in history["spans"].items()}
+    with st.sidebar.expander("📈 Hiệu năng (perf)"):
+        st.caption(f"Lượt chạy này: {(time.perf_counter() - run.started) * 1000:,.0f} ms đến lúc hiển thị")
+        current = pd.DataFrame(run.spans)
+        if "query_ids" in current:
+            current["query_ids"] = current["query_ids"].map(lambda ids: ", ".join(ids) if isinstance(ids, list) else "")
+        st.dataframe(current, hide_index=True)
+        if runs:
+            st.caption("Theo trang (p50/p95, ms)")
+            st.dataframe(_percentile_rows(runs, ("PAGE", "SCOPE")), hide_index=True)
+            st.caption("Theo span (p50/p95, ms)")
+            st.dataframe(_percentile_rows(spans, ("KIND", "NAME")), hide_index=True)
+
 # =============================================================================
 # 3. HÀM LOAD DỮ LIỆU
 # =============================================================================
 
-@st.cache_data(ttl=3600)
-def load_data(_session, table_name):
-    """Load dữ liệu từ bảng Snowflake và chuyển sang Pandas DataFrame"""
+# Gọi tên đầy đủ Database.Schema.Table để tránh lỗi
+# Đảm bảo bạn đã thay đúng tên DB và Schema nếu khác mặc định
+REPORTS_SCHEMA = "TPCH_ANALYTICS_DB.REPORTS"
+
+@st.cache_resource
+def _data_cache_stats():
+    """Số lần gọi / miss của từng hàm st.cache_data, dùng chung trong process"""
+    return {"calls": {}, "misses": {}, "lock": threading.Lock()}
+
+def _count_data_cache(outcome, name):
+    stats = _data_cache_stats()
+    with stats["lock"]:
+        stats[outcome][name] = stats[outcome].get(name, 0) + 1
+
+# st.cache_data không lưu exception: các hàm load_* raise khi lỗi và caller
+# báo lỗi, nên lỗi tạm thời không bị cache. TTL là lưới an toàn cho trường
+# hợp khoá phiên bản không thấy được thay đổi (hoặc không đọc được: None).
+DATA_CACHE_TTL_SECONDS = int(os.environ.get("TPCH_DASHBOARD_CACHE_TTL", "3600"))
+
+def tracked_cache_data(**cache_kwargs):
+    """st.cache_data kèm đếm hit/miss (thân hàm chỉ chạy khi miss)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def on_miss(*args, **kwargs):
+            _count_data_cache("misses", func.__name__)
+            return func(*args, **kwargs)
+
+        cached = st.cache_data(**cache_kwargs)(on_miss)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            _count_data_cache("calls", func.__name__)
+            return cached(*args, **kwargs)
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+def data_cache_totals():
+    """(số lần gọi, số miss) cộng dồn mọi hàm st.cache_data được theo dõi"""
+    stats = _data_cache_stats()
+    with stats["lock"]:
+        return sum(stats["calls"].values()), sum(stats["misses"].values())
+
+# Các cột mà các trang thực sự dùng (bỏ GENERATED_AT và các metric không vẽ)
+TABLE_COLUMNS = {
+    "MONTHLY_SALES_REPORT": (
+        "REPORT_DATE", "YEAR", "MONTH", "QUARTER", "MONTH_NAME",
+        "TOTAL_ORDERS", "TOTAL_REVENUE", "MOM_REVENUE_GROWTH",
+    ),
+    "CUSTOMER_METRICS": (
+        "C_CUSTKEY", "C_NAME", "C_NATION", "C_REGION", "C_MKTSEGMENT",
+        "RECENCY_DAYS", "FREQUENCY", "MONETARY", "RFM_SEGMENT", "LIFETIME_VALUE",
+    ),
+    "PRODUCT_PERFORMANCE": (
+        "P_PARTKEY", "P_NAME", "P_BRAND", "TOTAL_QUANTITY_SOLD", "TOTAL_REVENUE",
+    ),
+    "REGIONAL_ANALYSIS": (
+        "REGION_NAME", "NATION_NAME", "YEAR", "QUARTER",
+        "TOTAL_CUSTOMERS", "TOTAL_ORDERS", "TOTAL_REVENUE", "MARKET_SHARE",
+    ),
+}
+
+# Chuỗi có ít giá trị phân biệt -> category; tỷ lệ % -> float32.
+# Các cột tiền (REVENUE, MONETARY...) giữ float64 để tổng KPI không lệch.
+CATEGORY_COLUMNS = {
+    "RFM_SEGMENT", "REGION_NAME", "NATION_NAME", "C_NATION", "C_REGION",
+    "C_MKTSEGMENT", "P_BRAND", "MONTH_NAME",
+}
+FLOAT32_COLUMNS = {"MOM_REVENUE_GROWTH", "YOY_REVENUE_GROWTH", "MARKET_SHARE", "AVG_DISCOUNT"}
+DATE_COLUMNS = {"REPORT_DATE", "FIRST_ORDER_DATE", "LAST_ORDER_DATE"}
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+
+def compact_dtypes(df):
+    """Ép kiểu gọn cho một DataFrame: category, int32, float32, datetime64"""
+    for column in df.columns:
+        series = df[column]
+        if column in CATEGORY_COLUMNS:
+            df[column] = series.astype("category")
+        elif column in DATE_COLUMNS:
+            df[column] = pd.to_datetime(series)
+        elif column in FLOAT32_COLUMNS:
+            df[column] = pd.to_numeric(series).astype("float32")
+        elif pd.api.types.is_integer_dtype(series) and not series.empty \
+                and INT32_MIN <= series.min() and series.max() <= INT32_MAX:
+            df[column] = series.astype("int32")
+    return df
+
+def _concat_batches(batches, columns):
+    """Ghép các batch đã ép kiểu, hợp nhất category giữa các batch"""
+    if not batches:
+        return pd.DataFrame(columns=list(columns))
+    if len(batches) == 1:
+        return batches[0]
+    categorical = [c for c in batches[0].columns if isinstance(batches[0][c].dtype, pd.CategoricalDtype)]
+    frame = pd.concat([batch.drop(columns=categorical) for batch in batches], ignore_index=True)
+    for column in categorical:
+        frame[column] = union_categoricals([batch[column] for batch in batches], ignore_order=True)
+    return frame[list(batches[0].columns)]
+
+def fetch_table(session, table_name, compact=True, since=None):
+    """
+    Kéo một bảng REPORTS về Pandas.
+    compact=True: chỉ chọn cột trong TABLE_COLUMNS, đọc theo từng Arrow batch
+    (to_pandas_batches) và ép kiểu gọn từng batch để giảm bộ nhớ đỉnh.
+    compact=False: SELECT * + to_pandas() như cách cũ.
+    since: chỉ kéo các dòng GENERATED_AT > since (tuỳ chọn).
+    """
+    return get_backend(session).fetch_table(table_name, compact, since)
+
+# -----------------------------------------------------------------------------
+# 3.1 DISK CACHE - Snapshot Feather dùng chung giữa các process trên một host
+# -----------------------------------------------------------------------------
+# st.cache_data chỉ nằm trong RAM của từng process: mỗi lần restart pod hoặc
+# thêm replica đều phải tải lại từ Snowflake. Tầng cache đĩa lưu snapshot của
+# bảng gold dưới dạng Feather (không nén để memory-map được), đặt tên theo
+# bảng + phiên bản GENERATED_AT, ghi nguyên tử và giới hạn dung lượng (LRU).
+
+DISK_CACHE_DIR = os.environ.get(
+    "TPCH_DASHBOARD_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tpch_dashboard_cache")
+)
+DISK_CACHE_MAX_BYTES = int(os.environ.get("TPCH_DASHBOARD_CACHE_MAX_MB", "1024")) * 1024**2
+
+def fetch_fingerprint(session, table_name):
+    """
+    Fingerprint rẻ của bảng gold: (MAX(GENERATED_AT), COUNT(*), LAST_ALTERED).
+    Một truy vấn aggregate + metadata, không kéo dữ liệu về. LAST_ALTERED bắt
+    được cả UPDATE không đổi GENERATED_AT và số dòng (vd. MOM_REVENUE_GROWTH
+    trong SP_GENERATE_MONTHLY_SALES_REPORT chạy sau INSERT).
+    """
+    return get_backend(session).fingerprint(table_name)
+
+def version_key(watermark, row_count, altered=None):
+    """Chuỗi phiên bản dùng làm khoá cache (RAM và tên file trên đĩa)"""
+    stamp = watermark.strftime("%Y%m%dT%H%M%S%f") if watermark is not None else "empty"
+    key = f"{stamp}-{row_count}"
+    if altered is not None:
+        # LAST_ALTERED có múi giờ: đổi sang UTC để khoá không phụ thuộc session
+        altered = altered.tz_convert("UTC") if altered.tzinfo else altered
+        key += f"-{altered.strftime('%Y%m%dT%H%M%S%f')}"
+    return key
+
+@st.cache_resource
+def _disk_cache_stats():
+    """Bộ đếm hit/miss của cache đĩa, dùng chung cho mọi session trong process"""
+    return {"hits": 0, "misses": 0, "lock": threading.Lock()}
+
+def _count_disk_cache(outcome):
+    stats = _disk_cache_stats()
+    with stats["lock"]:
+        stats[outcome] += 1
+
+def _disk_cache_path(table_name, version, compact):
+    mode = "compact" if compact else "full"
+    return os.path.join(DISK_CACHE_DIR, f"{table_name}__{mode}__{version}.feather")
+
+def read_disk_cache(table_name, version, compact=True):
+    """Đọc snapshot (memory-map, chỉ đọc) nếu có, trả về None nếu chưa có"""
+    path = _disk_cache_path(table_name, version, compact)
+    try:
+        table = feather.read_table(path, memory_map=True)
+        os.utime(path)  # Đánh dấu vừa dùng cho LRU
+    except (FileNotFoundError, OSError):
+        _count_disk_cache("misses")
+        return None
+    _count_disk_cache("hits")
+    # split_blocks: mỗi cột một block, cột số không NULL trỏ thẳng vào vùng nhớ
+    # đã map thay vì gộp/sao chép thành block 2 chiều; self_destruct: giải phóng
+    # bộ đệm Arrow của từng cột ngay sau khi chuyển (cột chuỗi vẫn phải sao chép)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def write_disk_cache(table_name, version, compact, df):
+    """Ghi snapshot nguyên tử (file tạm + os.replace) rồi dọn cache theo LRU"""
+    os.makedirs(DISK_CACHE_DIR, exist_ok=True)
+    path = _disk_cache_path(table_name, version, compact)
+    fd, tmp_path = tempfile.mkstemp(dir=DISK_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.chmod(tmp_path, 0o644)  # mkstemp tạo file 0600, các worker khác cần đọc được
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Snapshot cũ của cùng bảng không còn được tham chiếu
+    mode = "compact" if compact else "full"
+    for old_path in glob.glob(os.path.join(DISK_CACHE_DIR, f"{table_name}__{mode}__*.feather")):
+        if old_path != path:
+            _remove_quietly(old_path)
+    evict_disk_cache()
+
+def evict_disk_cache(max_bytes=DISK_CACHE_MAX_BYTES):
+    """Xoá snapshot ít được dùng nhất cho tới khi tổng dung lượng <= max_bytes"""
+    entries = []
+    for path in glob.glob(os.path.join(DISK_CACHE_DIR, "*.feather")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue  # Process khác vừa xoá
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove_quietly(path)
+        total -= size
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+@tracked_cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=32)
+def load_data(_session, table_name, version, compact=True):
+    """
+    Load dữ liệu từ bảng Snowflake và chuyển sang Pandas DataFrame.
+    Thứ tự: RAM (st.cache_data) -> snapshot trên đĩa -> Snowflake.
+    Lỗi tải được raise (không cache), caller báo lỗi.
+    """
+    if version is None:
+        return fetch_table(_session, table_name, compact=compact)
+    df = read_disk_cache(table_name, version, compact)
+    if df is not None:
+        return df
+    df = fetch_table(_session, table_name, compact=compact)
+    try:
+        write_disk_cache(table_name, version, compact, df)
+    except OSError as e:
+        st.warning(f"Không ghi được cache đĩa cho {table_name}: {e}")
+    return df
+
+# -----------------------------------------------------------------------------
+# 3.2 SNAPSHOT STORE - Làm mới tăng dần + stale-while-revalidate
+# -----------------------------------------------------------------------------
+# Thay vì xoá sạch cache rồi tải lại toàn bộ, mỗi bảng giữ một entry gồm
+# fingerprint (watermark GENERATED_AT + số dòng + LAST_ALTERED) và snapshot
+# nếu bảng được tải nguyên. Khi làm mới: fingerprint không đổi -> bỏ qua;
+# watermark tiến lên -> chỉ kéo các dòng GENERATED_AT > watermark cũ rồi merge
+# theo khoá chính; số dòng không khớp sau khi merge (có dòng bị xoá...) hoặc
+# bảng đổi mà watermark đứng yên (UPDATE tại chỗ) -> tải lại toàn bộ.
+#
+# Entry cũ hơn SNAPSHOT_SOFT_TTL_SECONDS vẫn được trả về ngay, việc làm mới
+# chạy ở worker thread và hoán đổi entry mới vào khi xong, nên người dùng
+# không phải chờ Snowflake.
+
+SNAPSHOT_SOFT_TTL_SECONDS = int(os.environ.get("TPCH_DASHBOARD_SOFT_TTL", "300"))
+
+PRIMARY_KEYS = {
+    "MONTHLY_SALES_REPORT": ("REPORT_DATE",),
+    "CUSTOMER_METRICS": ("C_CUSTKEY",),
+    "PRODUCT_PERFORMANCE": ("P_PARTKEY",),
+    "REGIONAL_ANALYSIS": ("REGION_NAME", "NATION_NAME", "YEAR", "QUARTER"),
+}
+
+@st.cache_resource
+def _snapshot_store():
+    """Entry các bảng gold dùng chung cho mọi session trong process"""
+    return {
+        "tables": {},
+        "refreshing": set(),
+        "errors": {},
+        "lock": threading.Lock(),
+        "table_locks": {},
+        "executor": ThreadPoolExecutor(max_workers=2, thread_name_prefix="snapshot-refresh"),
+    }
+
+def _put_entry(table_name, fingerprint, df=None):
+    """Thay entry của bảng bằng một entry mới (hoán đổi nguyên tử)"""
+    now = time.time()
+    watermark, row_count, _ = fingerprint
+    entry = {
+        "df": df,
+        "fingerprint": fingerprint,
+        "watermark": watermark,
+        "row_count": row_count,
+        "version": version_key(*fingerprint),
+        "checked_at": now,
+        "refreshed_at": now,
+    }
+    store = _snapshot_store()
+    with store["lock"]:
+        store["tables"][table_name] = entry
+    return entry
+
+def _table_lock(table_name):
+    """
+    Khoá riêng của một bảng: tạo entry lần đầu và làm mới chạy tuần tự theo
+    bảng, nên các worker song song không cùng bắn truy vấn fingerprint/tải
+    nguội, và không ghi đè entry vừa được worker khác tạo
+    """
+    store = _snapshot_store()
+    with store["lock"]:
+        return store["table_locks"].setdefault(table_name, threading.Lock())
+
+def merge_delta(base, delta, keys):
+    """Ghi đè các dòng của base có cùng khoá với delta và thêm các dòng mới"""
+    if delta.empty:
+        return base
+    keys = list(keys)
+    replaced = pd.MultiIndex.from_frame(base[keys]).isin(pd.MultiIndex.from_frame(delta[keys]))
+    return _concat_batches([base[~replaced], delta], base.columns)
+
+def refresh_snapshot(session, table_name):
+    """
+    Làm mới entry của một bảng.
+    Trả về "unchanged", "incremental", "full" hoặc "version" (bảng không có
+    snapshot, chỉ cập nhật phiên bản).
+    """
+    with _table_lock(table_name):
+        return _refresh_snapshot(session, table_name)
+
+def _refresh_snapshot(session, table_name):
+    entry = _snapshot_store()["tables"].get(table_name)
+    fingerprint = fetch_fingerprint(session, table_name)
+    watermark, row_count, _ = fingerprint
+    if entry is not None and fingerprint == entry["fingerprint"]:
+        entry["checked_at"] = time.time()
+        return "unchanged"
+    if entry is None or entry["df"] is None:
+        _put_entry(table_name, fingerprint)
+        return "version"
+
+    df, status = None, "incremental"
+    # Watermark đứng yên mà bảng đổi: UPDATE tại chỗ, không kéo tăng dần được
+    if entry["watermark"] is not None and watermark != entry["watermark"] and row_count >= entry["row_count"]:
+        delta = fetch_table(session, table_name, since=entry["watermark"])
+        merged = merge_delta(entry["df"], delta, PRIMARY_KEYS[table_name])
+        if len(merged) == row_count:
+            df = merged
+    if df is None:
+        df, status = fetch_table(session, table_name), "full"
+
+    try:
+        write_disk_cache(table_name, version_key(*fingerprint), True, df)
+    except OSError:
+        pass  # Cache đĩa chỉ là tối ưu, snapshot trong RAM vẫn dùng được
+    _put_entry(table_name, fingerprint, df)
+    return status
+
+def refresh_all_snapshots(session):
+    """Làm mới tăng dần mọi bảng đang theo dõi, trả về trạng thái từng bảng"""
+    results = {}
+    for table_name in list(_snapshot_store()["tables"]):
+        try:
+            results[table_name] = refresh_snapshot(session, table_name)
+        except Exception as e:
+            results[table_name] = f"lỗi: {e}"
+    return results
+
+def _refresh_in_background(table_name):
+    """Đưa việc làm mới vào worker thread, mỗi bảng tối đa một lần cùng lúc"""
+    store = _snapshot_store()
+    pool = get_session_pool()
+    with store["lock"]:
+        if table_name in store["refreshing"]:
+            return
+        store["refreshing"].add(table_name)
+
+    def _run():
+        try:
+            with pool.session(tag=query_tag("background-refresh")) as refresh_session:
+                refresh_snapshot(refresh_session, table_name)
+            store["errors"].pop(table_name, None)
+        except Exception as e:
+            store["errors"][table_name] = str(e)  # Giữ snapshot cũ, thử lại lần sau
+        finally:
+            with store["lock"]:
+                store["refreshing"].discard(table_name)
+
+    store["executor"].submit(_run)
+
+def _get_entry(session, table_name, with_data):
+    """Lấy entry hiện có (làm mới nền nếu đã cũ) hoặc tạo mới đồng bộ"""
+    store = _snapshot_store()
+
+    def missing(entry):
+        return entry is None or (with_data and entry["df"] is None)
+
+    entry = store["tables"].get(table_name)
+    if missing(entry):
+        with _table_lock(table_name):
+            # Kiểm tra lại sau khi có khoá: worker khác có thể vừa tạo entry. Lời
+            # gọi chỉ cần phiên bản không bao giờ thay entry đã có (giữ nguyên df)
+            entry = store["tables"].get(table_name)
+            if missing(entry):
+                fingerprint = fetch_fingerprint(session, table_name)
+                df = load_data(session, table_name, version_key(*fingerprint)) if with_data else None
+                entry = _put_entry(table_name, fingerprint, df)
+        return entry
+    if time.time() - entry["checked_at"] > SNAPSHOT_SOFT_TTL_SECONDS:
+        _refresh_in_background(table_name)
+    return entry
+
+def get_table_version(session, table_name):
+    """Phiên bản hiện tại của bảng, None nếu không đọc được (bỏ qua cache)"""
     try:
-        # Gọi tên đầy đủ Database.Schema.Table để tránh lỗi
-        # Đảm bảo bạn đã thay đúng tên DB và Schema nếu khác mặc định
-        full_table_name = f"TPCH_ANALYTICS_DB.REPORTS.{table_name}"
-        return _session.table(full_table_name).to_pandas()
+        entry = _get_entry(session, table_name, with_data=False)
+    except Exception:
+        return None
+    return entry["version"] if entry else None
+
+def get_snapshot(session, table_name):
+    """
+    Trả về snapshot của bảng (bản sao nông, không sửa tại chỗ).
+    Lần đầu: RAM -> đĩa -> Snowflake qua load_data. Sau đó luôn trả về ngay,
+    việc làm mới tăng dần chạy nền khi snapshot quá soft TTL.
+    """
+    try:
+        entry = _get_entry(session, table_name, with_data=True)
     except Exception as e:
         st.error(f"Lỗi khi load bảng {table_name}: {e}")
         return pd.DataFrame()
+    return entry["df"].copy(deep=False) if entry else pd.DataFrame()
+
+def show_data_freshness():
+    """Chỉ báo "dữ liệu tính đến" trong sidebar theo snapshot cũ nhất"""
+    store = _snapshot_store()
+    entries = list(store["tables"].values())
+    if not entries:
+        return
+    checked_at = min(entry["checked_at"] for entry in entries)
+    age_minutes = (time.time() - checked_at) / 60
+    status = " · đang làm mới..." if store["refreshing"] else ""
+    st.sidebar.caption(
+        f"🕒 Dữ liệu tính đến {datetime.fromtimestamp(checked_at):%H:%M:%S} "
+        f"({age_minutes:,.0f} phút trước){status}"
+    )
+    for table_name, error in store["errors"].items():
+        st.sidebar.caption(f"⚠️ {table_name}: {error}")
+
+# -----------------------------------------------------------------------------
+# 3.3 QUERY LAYER - Đẩy phép tổng hợp xuống Snowflake
+# -----------------------------------------------------------------------------
+# Mỗi biểu đồ khai báo phép tổng hợp nó cần (tổng theo nhóm, đếm theo nhóm,
+# top-N theo chỉ số...). Snowflake thực hiện phép tính và chỉ trả về đúng các
+# dòng được vẽ, thay vì kéo toàn bộ bảng gold về rồi groupby bằng Pandas.
+
+AGGREGATE_KINDS = (
+    "count", "count_by", "top_n", "stratified_sample", "density_2d", "distinct", "rows",
+)
+
+@tracked_cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=256)
+def load_aggregate(_session, table_name, kind, version=None, by=None, value=None, n=None, columns=None,
+                   filters=()):
+    """
+    Chạy một phép tổng hợp trên bảng REPORTS và trả về kết quả (đã thu gọn).
+    version chỉ dùng làm khoá cache: bảng đổi phiên bản thì kết quả tự làm mới.
+    filters: bộ lọc đã chuẩn hoá (normalize_filters), chạy thành WHERE trước
+    phép tổng hợp; mỗi tổ hợp bộ lọc là một mục cache riêng.
+    - count:    số dòng của bảng (cột ROW_COUNT)
+    - count_by: COUNT(*) GROUP BY by (cột ROW_COUNT), giảm dần
+    - top_n:    n dòng có value lớn nhất, chỉ lấy các cột trong columns
+    - stratified_sample: khoảng n dòng cho mỗi giá trị của by (sample_by)
+    - density_2d: đếm số dòng trên lưới n x n của hai cột columns=(x, y),
+      trả về X_BIN, Y_BIN, ROW_COUNT và X_MIN, X_STEP, Y_MIN, Y_STEP
+    - distinct: các tổ hợp giá trị khác nhau của columns (lựa chọn cho bộ lọc)
+    - rows:     mọi dòng khớp bộ lọc, chỉ lấy các cột trong columns (ép kiểu gọn)
+    """
+    if kind not in AGGREGATE_KINDS:
+        raise ValueError(f"Phép tổng hợp không hỗ trợ: {kind}")
+
+    return get_backend(_session).aggregate(table_name, kind, by=by, value=value, n=n, columns=columns,
+                                           filters=filters)
+
+def query_aggregate(session, table_name, kind, selection=(), **params):
+    """
+    Chạy load_aggregate theo phiên bản GENERATED_AT hiện tại của bảng.
+    selection: lựa chọn của bộ lọc toàn cục, chỉ phần áp dụng được cho bảng.
+    Lỗi được báo tại đây và trả về DataFrame rỗng (không lưu vào cache).
+    """
+    try:
+        return load_aggregate(
+            session, table_name, kind, version=get_table_version(session, table_name),
+            filters=table_filters(table_name, selection), **params
+        )
+    except Exception as e:
+        st.error(f"Lỗi khi tổng hợp bảng {table_name} ({kind}): {e}")
+        return pd.DataFrame()
+
+def load_count(session, table_name, selection=()):
+    """Đếm số dòng của bảng (khớp bộ lọc toàn cục) ngay trên Snowflake"""
+    result = query_aggregate(session, table_name, "count", selection)
+    return int(result["ROW_COUNT"].iloc[0]) if not result.empty else 0
+
+# Bộ lọc được chuẩn hoá thành tuple ((cột, (giá trị, ...)), ...) để làm khoá
+# cache ổn định; mỗi cột thành một điều kiện IN, các cột nối bằng AND.
+
+def normalize_filters(filters):
+    """dict/iterable {cột: giá trị hoặc list giá trị} -> tuple đã sắp xếp, bỏ cột rỗng"""
+    items = filters.items() if isinstance(filters, dict) else filters
+    normalized = []
+    for column, values in items:
+        if not isinstance(values, (list, tuple, set)):
+            values = (values,)
+        # Giá trị numpy (vd. YEAR từ DataFrame) -> kiểu Python để lit() nhận được
+        values = tuple(sorted({getattr(v, "item", lambda v=v: v)() for v in values}, key=str))
+        if values:
+            normalized.append((column, values))
+    return tuple(sorted(normalized))
+
+def compile_filters(filters):
+    """Biên dịch bộ lọc đã chuẩn hoá thành biểu thức WHERE của Snowpark (None nếu rỗng)"""
+    from snowflake.snowpark.functions import col, lit
+    condition = None
+    for column, values in filters:
+        clause = col(column) == lit(values[0]) if len(values) == 1 else col(column).isin(list(values))
+        condition = clause if condition is None else condition & clause
+    return condition
+
+# Bộ lọc toàn cục (sidebar) áp dụng cho mọi trang. Lựa chọn được chuẩn hoá
+# theo tên bộ lọc; mỗi bảng ánh xạ bộ lọc sang cột của nó, bảng không có cột
+# tương ứng thì bỏ qua bộ lọc đó.
+GLOBAL_FILTERS = {
+    "region": "Vùng",
+    "nation": "Quốc gia",
+    "year": "Năm",
+    "quarter": "Quý",
+    "segment": "Phân khúc thị trường",
+}
+FILTER_COLUMNS = {
+    "MONTHLY_SALES_REPORT": {"year": "YEAR", "quarter": "QUARTER"},
+    "CUSTOMER_METRICS": {"region": "C_REGION", "nation": "C_NATION", "segment": "C_MKTSEGMENT"},
+    "REGIONAL_ANALYSIS": {"region": "REGION_NAME", "nation": "NATION_NAME", "year": "YEAR", "quarter": "QUARTER"},
+}
+
+def table_filters(table_name, selection):
+    """Lựa chọn của bộ lọc toàn cục -> bộ lọc đã chuẩn hoá trên các cột của bảng"""
+    columns = FILTER_COLUMNS.get(table_name, {})
+    return normalize_filters([(columns[name], values) for name, values in selection if name in columns])
+
+def ignored_filters(table_name, selection):
+    """Tên các bộ lọc đang chọn nhưng không áp dụng được cho bảng"""
+    columns = FILTER_COLUMNS.get(table_name, {})
+    return [GLOBAL_FILTERS[name] for name, _ in selection if name not in columns]
+
+def applied_filters(table_name, selection):
+    """Tên các bộ lọc đang chọn áp dụng được cho bảng"""
+    columns = FILTER_COLUMNS.get(table_name, {})
+    return [GLOBAL_FILTERS[name] for name, _ in selection if name in columns]
+
+@tracked_cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=256)
+def load_page_count(_session, table_name, version, filters=(), search_column=None, search=""):
+    """Số dòng khớp bộ lọc (để tính số trang)"""
+    return get_backend(_session).page_count(table_name, filters, search_column, search)
+
+@tracked_cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=256)
+def load_page(_session, table_name, version, columns, sort_by, ascending, page, page_size,
+              filters=(), search_column=None, search=""):
+    """
+    Một trang dữ liệu: WHERE + ORDER BY + LIMIT/OFFSET chạy trên Snowflake.
+    Khoá chính được thêm vào ORDER BY để thứ tự giữa các trang ổn định.
+    """
+    return get_backend(_session).page(table_name, columns, sort_by, ascending, page, page_size,
+                                      filters, search_column, search)
+
+# Tra cứu khách hàng: truy vấn điểm có tham số (bind variable) trên
+# CUSTOMER_METRICS, không kéo bảng về. Từ khoá toàn chữ số là C_CUSTKEY
+# (so khớp chính xác), còn lại là tiền tố C_NAME không phân biệt hoa thường.
+# Từ khoá được chuẩn hoá trước khi làm khoá cache để "customer#01" và
+# "Customer#01" dùng chung một mục; cache LRU nhỏ giữ các lượt tra cứu gần đây.
+LOOKUP_COLUMNS = (
+    "C_CUSTKEY", "C_NAME", "C_NATION", "C_REGION", "C_MKTSEGMENT", "RFM_SEGMENT",
+    "RECENCY_DAYS", "FREQUENCY", "MONETARY", "LIFETIME_VALUE", "FIRST_ORDER_DATE", "LAST_ORDER_DATE",
+)
+LOOKUP_LIMIT = 20
+LOOKUP_MIN_PREFIX = 5  # Search optimization SUBSTRING chỉ áp dụng cho hằng số >= 5 ký tự
+
+def normalize_lookup(term):
+    """Từ khoá người dùng nhập -> ("key", số) | ("name", TIỀN TỐ) | None nếu quá ngắn"""
+    term = term.strip()
+    # Chỉ chữ số ASCII: isdigit() nhận cả "²", "٣" mà int() không đổi được
+    if term.isascii() and term.isdigit():
+        return "key", int(term)
+    if len(term) < LOOKUP_MIN_PREFIX:
+        return None
+    return "name", term.upper()
+
+@tracked_cache_data(ttl=DATA_CACHE_TTL_SECONDS, max_entries=64)
+def lookup_customers(_session, version, by, value, limit=LOOKUP_LIMIT):
+    """Khách hàng khớp từ khoá đã chuẩn hoá (tối đa limit dòng, theo C_NAME)"""
+    return get_backend(_session).lookup_customers(by, value, limit)
+
+# -----------------------------------------------------------------------------
+# 3.4 DATASETS & PARALLEL LOADER
+# -----------------------------------------------------------------------------
+# Mỗi dataset là một hàm nhận session và lựa chọn của bộ lọc toàn cục, trả về
+# kết quả đã được cache (st.cache_data hoặc snapshot store). Các dataset độc lập nên được tải song
+# song để thời gian cold start bằng truy vấn chậm nhất thay vì tổng các round
+# trip.
+
+# Số khách lấy mẫu cho mỗi phân khúc RFM (scatter WebGL) và độ phân giải lưới mật độ
+RFM_SAMPLE_PER_SEGMENT = 500
+RFM_DENSITY_BINS = 60
+
+def load_monthly_sales(session, selection):
+    """Không lọc: snapshot cả bảng (nhỏ, có cache đĩa); có lọc: WHERE chạy trên Snowflake"""
+    if not table_filters("MONTHLY_SALES_REPORT", selection):
+        return get_snapshot(session, "MONTHLY_SALES_REPORT")
+    return query_aggregate(
+        session, "MONTHLY_SALES_REPORT", "rows", selection, columns=TABLE_COLUMNS["MONTHLY_SALES_REPORT"]
+    )
+
+DATASETS = {
+    "monthly_sales": load_monthly_sales,
+    "total_customers": lambda session, selection: load_count(session, "CUSTOMER_METRICS", selection),
+    # Cube dựng một lần cho mỗi phiên bản bảng; lựa chọn bộ lọc cắt cube lúc hiển thị
+    "sales_cube": lambda session, selection: load_cube(session, "MONTHLY_SALES_REPORT"),
+    "regional_cube": lambda session, selection: load_cube(session, "REGIONAL_ANALYSIS"),
+    "rfm_sample": lambda session, selection: query_aggregate(
+        session, "CUSTOMER_METRICS", "stratified_sample", selection, by="RFM_SEGMENT", n=RFM_SAMPLE_PER_SEGMENT,
+        columns=('C_NAME', 'RECENCY_DAYS', 'MONETARY', 'FREQUENCY', 'RFM_SEGMENT')
+    ),
+    "segment_counts": lambda session, selection: query_aggregate(
+        session, "CUSTOMER_METRICS", "count_by", selection, by="RFM_SEGMENT"
+    ),
+    "top_customers": lambda session, selection: query_aggregate(
+        session, "CUSTOMER_METRICS", "top_n", selection, value="LIFETIME_VALUE", n=10,
+        columns=('C_NAME', 'C_NATION', 'RFM_SEGMENT', 'LIFETIME_VALUE', 'FREQUENCY')
+    ),
+}
+
+# Giới hạn số truy vấn chạy đồng thời trên một session
+MAX_LOAD_WORKERS = 4
+
+def load_datasets(session, names, selection=()):
+    """
+    Tải song song các dataset bằng thread pool có giới hạn.
+    Trả về (dict tên -> dữ liệu, dict tên -> số giây tải).
+    """
+    # Gắn ScriptRunContext cho worker thread để st.cache_data / st.error hoạt động
+    ctx = get_script_run_ctx()
+    run = current_perf_run()
+
+    def _timed_load(name):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _run_state.perf = run
+        start = time.perf_counter()
+        with perf_span("load", name) as fields:
+            result = DATASETS[name](session, selection)
+            describe_result(fields, result)
+        return result, time.perf_counter() - start
+
+    data, timings = {}, {}
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_LOAD_WORKERS, len(names)))) as pool:
+        futures = {name: pool.submit(_timed_load, name) for name in names}
+        for name, future in futures.items():
+            data[name], timings[name] = future.result()
+    return data, timings
+
+def show_load_timings(timings):
+    """Hiển thị thời gian tải từng dataset ở sidebar (chậm nhất lên đầu)"""
+    with st.sidebar.expander("⏱️ Thời gian tải dữ liệu"):
+        for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+            st.caption(f"{name}: {seconds * 1000:,.0f} ms")
+
+# -----------------------------------------------------------------------------
+# 3.5 FIGURE CACHE - Memo biểu đồ Plotly theo phiên bản dữ liệu + widget
+# -----------------------------------------------------------------------------
+# Mỗi rerun (đổi năm, đổi radio chỉ số...) vốn dựng lại figure bằng px/
+# make_subplots rồi serialize lại từ đầu. Figure đã dựng được lưu dưới dạng
+# JSON, khoá theo (biểu đồ, phiên bản các bảng nguồn, trạng thái widget), nên
+# xem lại cùng trạng thái chỉ còn bước parse JSON. Dữ liệu đổi phiên bản thì
+# khoá cũ tự bị bỏ và bị đẩy ra theo LRU.
+
+FIGURE_CACHE_MAX_ENTRIES = int(os.environ.get("TPCH_DASHBOARD_FIGURE_CACHE_SIZE", "128"))
+
+class FigureCache:
+    """LRU các figure đã serialize (JSON), dùng chung cho mọi session trong process"""
+
+    def __init__(self, max_entries=FIGURE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_or_build(self, key, build):
+        """Trả về figure (dict) của key, gọi build() để dựng nếu chưa có"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+        if payload is None:
+            # Dựng ngoài lock: hai session cùng miss chỉ tốn thêm một lần dựng
+            payload = build().to_json()
+            with self._lock:
+                self.stats["misses"] += 1
+                self._entries[key] = payload
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return json.loads(payload)
+
+    def size_bytes(self):
+        with self._lock:
+            return sum(len(payload) for payload in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+def cached_figure(session, chart, tables, build, **state):
+    """
+    Figure của biểu đồ `chart` dựng từ các bảng `tables`, memo theo phiên bản
+    bảng và các widget state truyền vào. Không đọc được phiên bản thì dựng
+    trực tiếp (không cache).
+    """
+    versions = tuple(get_table_version(session, table_name) for table_name in tables)
+    if None in versions:
+        return build()
+    key = (chart, versions, tuple(sorted(state.items())))
+    return get_figure_cache().get_or_build(key, build)
+
+def show_cache_stats():
+    """Hit/miss của cache dữ liệu (st.cache_data), cache đĩa và figure cache trong sidebar"""
+    calls, misses = data_cache_totals()
+    st.sidebar.caption(
+        f"🗃️ Data cache: {calls - misses} hit / {misses} miss "
+        f"({100 * (calls - misses) / calls if calls else 0.0:.0f}%)"
+    )
+    disk = _disk_cache_stats()
+    disk_mb = sum(os.path.getsize(path) for path in glob.glob(os.path.join(DISK_CACHE_DIR, "*.feather"))) / 1024**2
+    st.sidebar.caption(f"💾 Cache đĩa: {disk['hits']} hit / {disk['misses']} miss, {disk_mb:,.1f} MB")
+    figures = get_figure_cache()
+    stats = figures.stats
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = 100 * stats["hits"] / lookups if lookups else 0.0
+    st.sidebar.caption(
+        f"🖼️ Figure cache: {stats['hits']} hit / {stats['misses']} miss ({hit_rate:.0f}%), "
+        f"{len(figures)}/{figures.max_entries} figure, {figures.size_bytes() / 1024**2:,.1f} MB, "
+        f"{stats['evictions']} bị đẩy ra"
+    )
+
+# -----------------------------------------------------------------------------
+# 3.6 BACKEND - Giao diện dữ liệu chung: Snowflake (Snowpark) và local (pandas)
+# -----------------------------------------------------------------------------
+# Các trang chỉ cần vài thao tác dữ liệu, khai báo trong DataBackend:
+# fingerprint, fetch_table, aggregate (các kiểu trong AGGREGATE_KINDS),
+# page_count, page, lookup_customers, export_batches và export_schema.
+# SnowflakeBackend đẩy chúng xuống Snowflake; LocalBackend chạy trên các bảng
+# REPORTS đọc từ Parquet, với cùng tham số và cùng dạng kết quả. Các hàm ở mục
+# 3-3.8 chỉ gọi get_backend(session).<thao tác>, nên thao tác mới chỉ cần thêm
+# vào protocol và hai class. Phần còn lại (pool, cache, snapshot, figure cache,
+# fragment, perf) chạy y hệt với cả hai backend, nên dùng được cho dev local,
+# benchmark tất định và CI.
+
+class DataBackend(Protocol):
+    """Các thao tác dữ liệu mà dashboard dùng (kết quả là DataFrame pandas, trừ export_schema)"""
+
+    def fingerprint(self, table_name): ...
+
+    def fetch_table(self, table_name, compact=True, since=None): ...
+
+    def aggregate(self, table_name, kind, by=None, value=None, n=None, columns=None, filters=()): ...
+
+    def page_count(self, table_name, filters=(), search_column=None, search=""): ...
+
+    def page(self, table_name, columns, sort_by, ascending, page, page_size,
+             filters=(), search_column=None, search=""): ...
+
+    def lookup_customers(self, by, value, limit): ...
+
+    def export_batches(self, table_name, filters): ...
+
+    def export_schema(self, table_name): ...
+
+def get_backend(session) -> DataBackend:
+    """Backend dữ liệu của session: LocalSession mang sẵn LocalBackend, còn lại là Snowflake"""
+    # Không dùng isinstance: script chạy lại mỗi lượt nên các class được định
+    # nghĩa lại, còn session trong pool (cache_resource) thuộc class cũ
+    return getattr(session, "dashboard_backend", None) or SnowflakeBackend(session)
+
+class SnowflakeBackend:
+    """DataBackend trên Session Snowpark: lọc và tổng hợp chạy trên Snowflake"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def _filtered(self, table_name, filters, search_column=None, search=""):
+        """Bảng REPORTS với WHERE của bộ lọc đã chuẩn hoá (chưa chạy truy vấn)"""
+        from snowflake.snowpark.functions import col, lit, upper
+        df = self.session.table(f"{REPORTS_SCHEMA}.{table_name}")
+        condition = compile_filters(filters)
+        if condition is not None:
+            df = df.filter(condition)
+        if search_column and search:
+            df = df.filter(upper(col(search_column)).startswith(lit(search.upper())))
+        return df
+
+    def fingerprint(self, table_name):
+        database, schema = REPORTS_SCHEMA.split(".")
+        row = self.session.sql(
+            f"SELECT f.WATERMARK, f.ROW_COUNT, t.LAST_ALTERED "
+            f"FROM (SELECT MAX(GENERATED_AT) AS WATERMARK, COUNT(*) AS ROW_COUNT FROM {REPORTS_SCHEMA}.{table_name}) f "
+            f"LEFT JOIN {database}.INFORMATION_SCHEMA.TABLES t ON t.TABLE_SCHEMA = ? AND t.TABLE_NAME = ?",
+            params=[schema, table_name],
+        ).collect()[0]
+        watermark = pd.Timestamp(row["WATERMARK"]) if row["WATERMARK"] is not None else None
+        altered = pd.Timestamp(row["LAST_ALTERED"]) if row["LAST_ALTERED"] is not None else None
+        return watermark, int(row["ROW_COUNT"]), altered
+
+    def fetch_table(self, table_name, compact=True, since=None):
+        from snowflake.snowpark.functions import col, lit
+        df = self.session.table(f"{REPORTS_SCHEMA}.{table_name}")
+        if since is not None:
+            df = df.filter(col("GENERATED_AT") > lit(since.to_pydatetime()))
+        if not compact:
+            return df.to_pandas()
+        columns = TABLE_COLUMNS.get(table_name)
+        if columns:
+            df = df.select(*columns)
+        batches = [compact_dtypes(batch) for batch in df.to_pandas_batches()]
+        return _concat_batches(batches, df.columns)
+
+    def aggregate(self, table_name, kind, by=None, value=None, n=None, columns=None, filters=()):
+        from snowflake.snowpark.functions import col, count, lit
+        df = self._filtered(table_name, filters)
+        if kind == "count":
+            query = df.agg(count(lit(1)).alias("ROW_COUNT"))
+        elif kind == "count_by":
+            query = (df.group_by(by)
+                .agg(count(lit(1)).alias("ROW_COUNT"))
+                .sort(col("ROW_COUNT").desc()))
+        elif kind == "top_n":
+            query = df.select(*columns).sort(col(value).desc()).limit(n)
+        elif kind == "stratified_sample":
+            # Tỷ lệ lấy mẫu mỗi nhóm = n / kích thước nhóm, để nhóm nhỏ không bị lấn át
+            sizes = df.group_by(by).agg(count(lit(1)).alias("ROW_COUNT")).collect()
+            fractions = {row[0]: min(1.0, n / row[1]) for row in sizes if row[0] is not None}
+            if not fractions:
+                return pd.DataFrame(columns=list(columns))
+            query = df.select(*columns).stat.sample_by(by, fractions)
+        elif kind == "density_2d":
+            return self._density_2d(df, columns, n)
+        elif kind == "distinct":
+            query = df.select(*columns).distinct().sort(*columns)
+        else:  # rows
+            return compact_dtypes(df.select(*columns).to_pandas())
+        return query.to_pandas()
+
+    @staticmethod
+    def _density_2d(df, columns, bins):
+        """Chia lưới bins x bins theo (x, y) và đếm trên Snowflake (tối đa bins² dòng)"""
+        from snowflake.snowpark.functions import col, count, floor, least, lit, max as max_, min as min_
+        x, y = columns
+        df = df.filter(col(x).is_not_null() & col(y).is_not_null())
+        bounds = df.agg(min_(x), max_(x), min_(y), max_(y)).collect()[0]
+        if bounds[0] is None:
+            return pd.DataFrame(columns=["X_BIN", "Y_BIN", "ROW_COUNT"])
+        x_min, x_max, y_min, y_max = (float(value) for value in bounds)
+        x_step = (x_max - x_min) / bins or 1.0
+        y_step = (y_max - y_min) / bins or 1.0
+
+        def _bin(column, low, step):
+            return least(floor((col(column) - lit(low)) / lit(step)), lit(bins - 1))
+
+        result = (df
+            .select(_bin(x, x_min, x_step).alias("X_BIN"), _bin(y, y_min, y_step).alias("Y_BIN"))
+            .group_by("X_BIN", "Y_BIN")
+            .agg(count(lit(1)).alias("ROW_COUNT"))
+            .to_pandas())
+        return result.assign(X_MIN=x_min, X_STEP=x_step, Y_MIN=y_min, Y_STEP=y_step)
+
+    def page_count(self, table_name, filters=(), search_column=None, search=""):
+        return self._filtered(table_name, filters, search_column, search).count()
+
+    def page(self, table_name, columns, sort_by, ascending, page, page_size,
+             filters=(), search_column=None, search=""):
+        from snowflake.snowpark.functions import col
+        keys = [key for key in PRIMARY_KEYS.get(table_name, ()) if key != sort_by]
+        order = col(sort_by).asc() if ascending else col(sort_by).desc()
+        selected = list(dict.fromkeys([*columns, sort_by, *keys]))
+        return (self._filtered(table_name, filters, search_column, search)
+            .select(*selected)
+            .sort(order, *[col(key) for key in keys])
+            .limit(page_size, offset=page * page_size)
+            .to_pandas()[list(columns)])
+
+    def lookup_customers(self, by, value, limit):
+        columns = ", ".join(LOOKUP_COLUMNS)
+        table = f"{REPORTS_SCHEMA}.CUSTOMER_METRICS"
+        if by == "key":
+            query, params = f"SELECT {columns} FROM {table} WHERE C_CUSTKEY = ?", [value]
+        else:
+            # Escape ký tự đại diện của LIKE trong từ khoá, chỉ giữ % ở cuối (tiền tố)
+            pattern = value.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+            query = f"SELECT {columns} FROM {table} WHERE C_NAME ILIKE ? ESCAPE '!' ORDER BY C_NAME LIMIT {int(limit)}"
+            params = [pattern]
+        return self.session.sql(query, params=params).to_pandas()
+
+    def export_batches(self, table_name, filters):
+        # Snowflake tự chia batch theo kết quả trả về
+        yield from self._filtered(table_name, filters).to_pandas_batches()
+
+    def export_schema(self, table_name):
+        # Theo kiểu cột của bảng, không theo batch: connector chọn int8..int64 theo
+        # dữ liệu của từng batch, và cột toàn NULL trong một batch không có kiểu
+        import pyarrow as pa
+        schema = self.session.table(f"{REPORTS_SCHEMA}.{table_name}").schema
+        return pa.schema([(field.name, self._arrow_type(field.datatype)) for field in schema.fields])
+
+    @staticmethod
+    def _arrow_type(datatype):
+        import pyarrow as pa
+        from snowflake.snowpark import types as T
+        if isinstance(datatype, (T.ByteType, T.ShortType, T.IntegerType, T.LongType)):
+            return pa.int64()
+        if isinstance(datatype, T.DecimalType):
+            # NUMBER(p,0) về pandas là số nguyên, NUMBER(p,s>0) là float64
+            return pa.int64() if datatype.scale == 0 else pa.float64()
+        if isinstance(datatype, (T.FloatType, T.DoubleType)):
+            return pa.float64()
+        if isinstance(datatype, T.BooleanType):
+            return pa.bool_()
+        if isinstance(datatype, T.DateType):
+            return pa.date32()
+        if isinstance(datatype, T.TimestampType):
+            aware = datatype.tz in (T.TimestampTimeZone.LTZ, T.TimestampTimeZone.TZ)
+            return pa.timestamp("ns", tz="UTC" if aware else None)
+        return pa.string()
+
+class LocalBackend:
+    """DataBackend trên các DataFrame trong RAM (chỉ đọc, dùng chung giữa các thread)"""
+
+    def __init__(self, tables):
+        self._tables = tables
+
+    def _table(self, table_name):
+        return self._tables[table_name]
+
+    def _filtered(self, table_name, filters, search_column=None, search=""):
+        df = self._table(table_name)
+        if not filters and not (search_column and search):
+            return df
+        mask = pd.Series(True, index=df.index)
+        for column, values in filters:
+            mask &= df[column].isin(values)
+        if search_column and search:
+            mask &= df[search_column].astype(str).str.upper().str.startswith(search.upper())
+        return df[mask]
+
+    def fingerprint(self, table_name):
+        df = self._table(table_name)
+        watermark = df["GENERATED_AT"].max() if len(df) else None
+        # Bảng trong RAM không bị sửa tại chỗ: không có LAST_ALTERED
+        return (pd.Timestamp(watermark) if pd.notna(watermark) else None), len(df), None
+
+    def fetch_table(self, table_name, compact=True, since=None):
+        df = self._table(table_name)
+        if since is not None:
+            df = df[df["GENERATED_AT"] > since]
+        if not compact:
+            return df.reset_index(drop=True)
+        columns = TABLE_COLUMNS.get(table_name) or list(df.columns)
+        return compact_dtypes(df[list(columns)].reset_index(drop=True))
+
+    def aggregate(self, table_name, kind, by=None, value=None, n=None, columns=None, filters=()):
+        df = self._filtered(table_name, filters)
+        if kind == "count":
+            return pd.DataFrame({"ROW_COUNT": [len(df)]})
+        if kind == "count_by":
+            return (df.groupby(by, observed=True).size().rename("ROW_COUNT").reset_index()
+                .sort_values("ROW_COUNT", ascending=False, ignore_index=True))
+        if kind == "top_n":
+            return df.nlargest(n, value)[list(columns)].reset_index(drop=True)
+        if kind == "stratified_sample":
+            # Xáo trộn với seed cố định rồi lấy n dòng đầu mỗi nhóm: tất định giữa các lần chạy
+            shuffled = df[df[by].notna()].sample(frac=1.0, random_state=0)
+            return shuffled.groupby(by, observed=True).head(n)[list(columns)].reset_index(drop=True)
+        if kind == "density_2d":
+            return self._density_2d(df, columns, n)
+        if kind == "distinct":
+            return df[list(columns)].drop_duplicates().sort_values(list(columns), ignore_index=True)
+        return compact_dtypes(df[list(columns)].reset_index(drop=True))  # rows
+
+    @staticmethod
+    def _density_2d(df, columns, bins):
+        x, y = columns
+        df = df[[x, y]].dropna().astype(float)
+        if df.empty:
+            return pd.DataFrame(columns=["X_BIN", "Y_BIN", "ROW_COUNT"])
+        x_min, x_max, y_min, y_max = df[x].min(), df[x].max(), df[y].min(), df[y].max()
+        x_step = (x_max - x_min) / bins or 1.0
+        y_step = (y_max - y_min) / bins or 1.0
+        cells = pd.DataFrame({
+            "X_BIN": ((df[x] - x_min) // x_step).clip(upper=bins - 1).astype("int64"),
+            "Y_BIN": ((df[y] - y_min) // y_step).clip(upper=bins - 1).astype("int64"),
+        })
+        result = cells.value_counts().rename("ROW_COUNT").reset_index()
+        return result.assign(X_MIN=x_min, X_STEP=x_step, Y_MIN=y_min, Y_STEP=y_step)
+
+    def page_count(self, table_name, filters=(), search_column=None, search=""):
+        return len(self._filtered(table_name, filters, search_column, search))
+
+    def page(self, table_name, columns, sort_by, ascending, page, page_size,
+             filters=(), search_column=None, search=""):
+        keys = [key for key in PRIMARY_KEYS.get(table_name, ()) if key != sort_by]
+        df = self._filtered(table_name, filters, search_column, search)
+        df = df.sort_values([sort_by, *keys], ascending=[ascending] + [True] * len(keys), kind="stable")
+        return df.iloc[page * page_size:(page + 1) * page_size][list(columns)].reset_index(drop=True)
+
+    def lookup_customers(self, by, value, limit):
+        df = self._table("CUSTOMER_METRICS")
+        if by == "key":
+            df = df[df["C_CUSTKEY"] == value]
+        else:
+            df = df[df["C_NAME"].astype(str).str.upper().str.startswith(value)].sort_values("C_NAME").head(limit)
+        return df[list(LOOKUP_COLUMNS)].reset_index(drop=True)
+
+    def export_batches(self, table_name, filters):
+        df = self._filtered(table_name, filters)
+        for start in range(0, len(df), EXPORT_BATCH_ROWS):
+            yield df.iloc[start:start + EXPORT_BATCH_ROWS].reset_index(drop=True)
+
+    def export_schema(self, table_name):
+        # Các batch là lát cắt của cùng một DataFrame: schema của cả bảng khớp mọi batch
+        import pyarrow as pa
+        return pa.Schema.from_pandas(self._table(table_name), preserve_index=False)
+
+class LocalSession:
+    """Thay thế Session Snowpark cho backend local: phần giao diện Session mà pool/perf dùng"""
+
+    def __init__(self, tables, label="LOCAL"):
+        self.dashboard_backend = LocalBackend(tables)
+        self.label = label
+        self.query_tag = None
+
+    @classmethod
+    def from_parquet(cls, directory):
+        """Đọc <TABLE>.parquet cho từng bảng trong TABLE_COLUMNS"""
+        tables = {}
+        for table_name in TABLE_COLUMNS:
+            path = os.path.join(directory, f"{table_name}.parquet")
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"Thiếu {path}. Tạo dữ liệu mẫu bằng: python benchmarks/make_local_data.py --out {directory}"
+                )
+            tables[table_name] = pd.read_parquet(path)
+        return cls(tables, label=f"LOCAL.{os.path.basename(os.path.abspath(directory))}")
+
+    def get_current_database(self):
+        return self.label.split(".")[0]
+
+    def get_current_schema(self):
+        return self.label.split(".", 1)[-1]
+
+    def create_dataframe(self, data):
+        return pd.DataFrame(data)
+
+    @contextmanager
+    def query_history(self, **kwargs):
+        yield SimpleNamespace(queries=[])  # Không có query id Snowflake
+
+    def close(self):
+        pass
+
+# -----------------------------------------------------------------------------
+# 3.7 CUBE - Tổng hợp sẵn trong RAM cho các bảng lưới nhỏ
+# -----------------------------------------------------------------------------
+# REGIONAL_ANALYSIS (vùng × quốc gia × năm × quý) và MONTHLY_SALES_REPORT
+# (năm × quý × tháng) là các lưới nhỏ và dày. Thay vì lọc + groupby DataFrame
+# mỗi lượt chạy, mỗi bảng được dựng một lần cho mỗi phiên bản thành mảng
+# NumPy đánh chỉ số theo chiều, kèm marginal tính sẵn theo từng chiều. KPI,
+# biểu đồ tròn và đường xu hướng khi đó chỉ là cắt mảng + sum.
+#
+# Tên chiều trùng tên bộ lọc toàn cục (GLOBAL_FILTERS) nên lựa chọn ở sidebar
+# dùng trực tiếp để cắt cube; bộ lọc không phải chiều của cube bị bỏ qua,
+# giống table_filters.
+
+CUBE_SPECS = {
+    "MONTHLY_SALES_REPORT": {
+        "dims": {"year": "YEAR", "quarter": "QUARTER", "month": "MONTH"},
+        "measures": ("TOTAL_REVENUE", "TOTAL_ORDERS"),
+    },
+    "REGIONAL_ANALYSIS": {
+        "dims": {"region": "REGION_NAME", "nation": "NATION_NAME", "year": "YEAR", "quarter": "QUARTER"},
+        "measures": ("TOTAL_REVENUE", "TOTAL_ORDERS"),
+    },
+}
+
+class ReportCube:
+    """Mảng NumPy dày theo các chiều + marginal tính sẵn (chỉ đọc, dùng chung giữa các thread)"""
+
+    def __init__(self, df, dims, measures):
+        df = df.dropna(subset=list(dims.values()))
+        self.dims = tuple(dims)
+        self.labels, self._positions, codes = {}, {}, []
+        for name, column in dims.items():
+            codes_, uniques = pd.factorize(df[column], sort=True)
+            labels = np.asarray(uniques)
+            self.labels[name] = labels
+            self._positions[name] = {label: i for i, label in enumerate(labels.tolist())}
+            codes.append(codes_)
+        shape = tuple(len(self.labels[name]) for name in self.dims)
+        cells = tuple(codes)
+
+        # ROW_COUNT: số dòng gốc của mỗi ô, để bỏ các ô rỗng của lưới dày
+        self._cells = {}
+        for measure, values in [("ROW_COUNT", np.ones(len(df)))] + [
+            (measure, df[measure].to_numpy(dtype="float64", na_value=0.0)) for measure in measures
+        ]:
+            grid = np.zeros(shape)
+            np.add.at(grid, cells, values)
+            self._cells[measure] = grid
+        self.measures = tuple(self._cells)
+
+        # Marginal theo từng chiều và tổng: dùng khi lựa chọn không cắt cube
+        self._marginals = {
+            (measure, name): grid.sum(axis=tuple(i for i in range(len(shape)) if i != axis))
+            for measure, grid in self._cells.items()
+            for axis, name in enumerate(self.dims)
+        }
+        self._totals = {measure: float(grid.sum()) for measure, grid in self._cells.items()}
+
+    def _cuts(self, selection):
+        """Lựa chọn có cắt chiều nào của cube không"""
+        return any(name in self._positions for name, _ in selection)
+
+    def _slice(self, measure, selection):
+        """Mảng của measure chỉ gồm các giá trị đang chọn trên mỗi chiều của cube"""
+        grid = self._cells[measure]
+        for name, values in selection:
+            if name in self._positions:
+                positions = sorted(self._positions[name][v] for v in values if v in self._positions[name])
+                grid = np.take(grid, positions, axis=self.dims.index(name))
+        return grid
+
+    def _collapse(self, grid, dims):
+        """Cộng dồn các chiều không nằm trong dims, trục theo đúng thứ tự dims"""
+        other = tuple(i for i, name in enumerate(self.dims) if name not in dims)
+        kept = [name for name in self.dims if name in dims]
+        return np.transpose(grid.sum(axis=other), [kept.index(name) for name in dims])
+
+    def _kept_labels(self, name, selection):
+        values = set(dict(selection).get(name, ()))
+        if not values:
+            return self.labels[name]
+        return np.asarray([label for label in self.labels[name].tolist() if label in values])
+
+    def total(self, measure, selection=()):
+        """Tổng measure trên các ô đang chọn"""
+        if not self._cuts(selection):
+            return self._totals[measure]
+        return float(self._slice(measure, selection).sum())
+
+    def by(self, dims, measure, selection=()):
+        """
+        Tổng measure theo một hoặc nhiều chiều: DataFrame gồm cột cho từng chiều
+        (nhãn) và cột measure, theo thứ tự nhãn, chỉ giữ các ô có dữ liệu gốc.
+        """
+        dims = (dims,) if isinstance(dims, str) else tuple(dims)
+        if len(dims) == 1 and not self._cuts(selection):
+            values = self._marginals[(measure, dims[0])]
+            counts = self._marginals[("ROW_COUNT", dims[0])]
+        else:
+            values = self._collapse(self._slice(measure, selection), dims)
+            counts = self._collapse(self._slice("ROW_COUNT", selection), dims)
+        keep = np.ravel(counts) > 0
+        # Nhãn của từng ô theo thứ tự ravel (C-order) của lưới kết quả
+        grids = np.meshgrid(*[self._kept_labels(name, selection) for name in dims], indexing="ij")
+        columns = {name: grid.ravel()[keep] for name, grid in zip(dims, grids)}
+        columns[measure] = np.ravel(values)[keep]
+        return pd.DataFrame(columns)
+
+    def is_empty(self, selection=()):
+        return self.total("ROW_COUNT", selection) == 0
+
+@st.cache_resource(max_entries=8)
+def _build_cube(table_name, version, _df):
+    """Dựng cube một lần cho mỗi (bảng, phiên bản); version chỉ dùng làm khoá"""
+    spec = CUBE_SPECS[table_name]
+    return ReportCube(_df, spec["dims"], spec["measures"])
+
+def load_cube(session, table_name):
+    """Cube của bảng theo phiên bản hiện tại (None nếu bảng rỗng/không đọc được)"""
+    df = get_snapshot(session, table_name)
+    if df.empty:
+        return None
+    version = get_table_version(session, table_name)
+    if version is None:
+        spec = CUBE_SPECS[table_name]
+        return ReportCube(df, spec["dims"], spec["measures"])
+    return _build_cube(table_name, version, df)
+
+# -----------------------------------------------------------------------------
+# 3.8 EXPORT - Xuất dữ liệu đã lọc ra CSV/Parquet theo từng batch
+# -----------------------------------------------------------------------------
+# Kết quả lọc được đọc từ Snowflake theo từng Arrow batch (to_pandas_batches)
+# và ghi thẳng vào file nén trên đĩa (gzip CSV hoặc Parquet zstd), nên bộ nhớ
+# chỉ chứa một batch tại một thời điểm dù xuất bao nhiêu dòng. Streamlit phục
+# vụ file tải về từ RAM, nên file nén bị giới hạn EXPORT_MAX_BYTES: vượt quá
+# thì dừng và yêu cầu người dùng lọc hẹp hơn. File cũ hơn EXPORT_MAX_AGE giây
+# bị xoá ở lần xuất kế tiếp.
+
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "tpch_dashboard_exports")
+EXPORT_MAX_BYTES = int(os.environ.get("TPCH_DASHBOARD_EXPORT_MAX_MB", "200")) * 1024**2
+EXPORT_MAX_AGE = 3600
+EXPORT_BATCH_ROWS = 100_000  # Chỉ dùng cho backend local (Snowflake tự chia batch)
+
+# Định dạng: (phần mở rộng, MIME)
+EXPORT_FORMATS = {
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+class ExportTooLarge(Exception):
+    """File xuất vượt EXPORT_MAX_BYTES"""
+
+def export_batches(session, table_name, filters):
+    """Các batch DataFrame của bảng sau WHERE, đọc lần lượt (không gộp)"""
+    return get_backend(session).export_batches(table_name, filters)
+
+def _remove_stale_exports(max_age=EXPORT_MAX_AGE):
+    for path in glob.glob(os.path.join(EXPORT_DIR, "*")):
+        try:
+            if time.time() - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+def write_export(session, table_name, filters, fmt, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Ghi kết quả lọc của bảng ra file nén, từng batch một.
+    Trả về (đường dẫn, số dòng); vượt max_bytes thì xoá file và raise ExportTooLarge.
+    """
+    _remove_stale_exports()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    extension = EXPORT_FORMATS[fmt][0]
+    fd, path = tempfile.mkstemp(prefix=f"{table_name}_", suffix=f".{extension}", dir=EXPORT_DIR)
+    os.close(fd)
+
+    def _check_size():
+        if os.path.getsize(path) > max_bytes:
+            raise ExportTooLarge(f"File vượt {max_bytes / 1024**2:,.0f} MB")
+
+    rows = 0
+    try:
+        if extension == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Schema theo kiểu cột của bảng (không theo batch đầu): mọi batch được
+            # ép về cùng kiểu, kể cả khi độ rộng số nguyên khác nhau giữa các batch
+            # hoặc một cột toàn NULL trong batch đầu
+            schema = get_backend(session).export_schema(table_name)
+            writer = None
+            try:
+                for batch in export_batches(session, table_name, filters):
+                    table = pa.Table.from_pandas(batch, schema=schema, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, schema, compression="zstd")
+                    writer.write_table(table)
+                    rows += len(batch)
+                    _check_size()
+            finally:
+                if writer is not None:
+                    writer.close()
+        else:
+            with gzip.open(path, "wt", newline="") as f:
+                for i, batch in enumerate(export_batches(session, table_name, filters)):
+                    batch.to_csv(f, header=i == 0, index=False)
+                    rows += len(batch)
+                    _check_size()
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return path, rows
 
 # =============================================================================
 # 4. CÁC COMPONENT HIỂN THỊ (Visualizations)
 # =============================================================================
 
-def show_executive_summary(monthly_sales, customer_metrics, regional_analysis):
+PAGE_SIZE = 50
+
+@component_fragment
+def paged_table(session, table_name, columns, key, default_sort=None, ascending=False,
+                search_column=None, filters=(), page_size=PAGE_SIZE):
+    """
+    Bảng phân trang phía server: chỉ trang đang xem được kéo từ Snowflake,
+    sắp xếp và tìm kiếm (tiền tố, không phân biệt hoa thường) chạy trên server.
+    """
+    filters = normalize_filters(filters)
+    sort_options = list(columns)
+    c1, c2, c3 = st.columns([2, 1, 2])
+    sort_by = c1.selectbox(
+        "Sắp xếp theo", sort_options,
+        index=sort_options.index(default_sort) if default_sort in sort_options else 0,
+        key=f"{key}_sort",
+    )
+    direction = c2.radio(
+        "Thứ tự", ["Giảm dần", "Tăng dần"], index=1 if ascending else 0,
+        horizontal=True, key=f"{key}_direction",
+    )
+    search = c3.text_input(f"Tìm theo {search_column}", key=f"{key}_search").strip() if search_column else ""
+
+    version = get_table_version(session, table_name)
+    try:
+        with perf_span("load", f"{table_name} (đếm)"):
+            total = load_page_count(session, table_name, version, filters, search_column, search)
+    except Exception as e:
+        st.error(f"Lỗi khi đếm dòng bảng {table_name}: {e}")
+        return
+    pages = max(1, math.ceil(total / page_size))
+
+    # Đổi bộ lọc/sắp xếp thì quay về trang 1
+    signature = (filters, sort_by, direction, search)
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_page"] = 1
+    page = st.number_input("Trang", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+
+    try:
+        with perf_span("load", f"{table_name} (trang)") as fields:
+            rows = load_page(
+                session, table_name, version, tuple(columns), sort_by, direction == "Tăng dần",
+                int(page) - 1, page_size, filters, search_column, search,
+            )
+            describe_result(fields, rows)
+    except Exception as e:
+        st.error(f"Lỗi khi tải trang bảng {table_name}: {e}")
+        return
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+    start = (int(page) - 1) * page_size
+    st.caption(f"Hiển thị {min(start + 1, total):,}–{min(start + page_size, total):,} / {total:,} dòng · trang {int(page)}/{pages}")
+
+@component_fragment
+def export_panel(session, table_name, selection):
+    """Xuất bảng theo bộ lọc toàn cục ra CSV/Parquet (chạy lại riêng, không tải lại trang)"""
+    key = f"export_{table_name}"
+    filters = table_filters(table_name, selection)
+    with st.expander(f"⬇️ Xuất dữ liệu {table_name}"):
+        if filters:
+            st.caption("Bộ lọc: " + "; ".join(f"{column} ∈ {', '.join(map(str, values))}" for column, values in filters))
+        else:
+            st.caption("Toàn bộ bảng (không có bộ lọc áp dụng được)")
+        fmt = st.radio("Định dạng", list(EXPORT_FORMATS), horizontal=True, key=f"{key}_format")
+        extension, mime = EXPORT_FORMATS[fmt]
+
+        if st.button("Chuẩn bị file", key=f"{key}_prepare"):
+            previous = st.session_state.pop(key, None)
+            if previous:
+                _remove_quietly(previous["path"])
+            with st.spinner("Đang xuất dữ liệu theo từng batch..."), perf_span("export", table_name):
+                try:
+                    path, rows = write_export(session, table_name, filters, fmt)
+                except ExportTooLarge as e:
+                    st.error(f"❌ {e}. Hãy chọn thêm bộ lọc để thu hẹp dữ liệu.")
+                else:
+                    st.session_state[key] = {"path": path, "rows": rows, "fmt": fmt, "filters": filters}
+
+        # Chỉ cho tải file khớp bộ lọc + định dạng đang chọn
+        export = st.session_state.get(key)
+        if export and (export["fmt"], export["filters"]) == (fmt, filters) and os.path.exists(export["path"]):
+            size_mb = os.path.getsize(export["path"]) / 1024**2
+            with open(export["path"], "rb") as f:
+                st.download_button(
+                    f"Tải {export['rows']:,} dòng ({size_mb:,.1f} MB)", f,
+                    file_name=f"{table_name.lower()}.{extension}", mime=mime, key=f"{key}_download",
+                )
+
+def show_executive_summary(session, selection, sales_cube, total_customers, regional_cube):
     st.title("🏠 Executive Summary")
     st.markdown("---")
     
-    if monthly_sales.empty:
+    if sales_cube is None or sales_cube.is_empty(selection):
         st.warning("Chưa có dữ liệu. Vui lòng kiểm tra lại Pipeline.")
         return
+    import plotly.express as px
+
     # Tùy chỉnh giao diện KPI cards cho nền trắng, chữ đen
     with st.container():
             # CSS tùy chỉnh cho KPI cards: Nền trắng, chữ đen
@@ -114,21 +1935,32 @@ def show_executive_summary(monthly_sales, customer_metrics, regional_analysis):
             </style>
         """, unsafe_allow_html=True)
 
-    # --- KPI CARDS ---
-    total_revenue = monthly_sales['TOTAL_REVENUE'].sum()
-    total_orders = monthly_sales['TOTAL_ORDERS'].sum()
-    total_customers = len(customer_metrics)
-    
+    # --- KPI CARDS (cắt cube, không groupby lại DataFrame) ---
+    # MONTHLY_SALES_REPORT không có vùng/quốc gia: khi lọc theo chúng, doanh thu
+    # và số đơn lấy từ REGIONAL_ANALYSIS (cũng có TOTAL_REVENUE, TOTAL_ORDERS)
+    # để cùng phạm vi với số khách hàng
+    revenue_table, revenue_cube = "MONTHLY_SALES_REPORT", sales_cube
+    if regional_cube is not None and any(name in ("region", "nation") for name, _ in selection):
+        revenue_table, revenue_cube = "REGIONAL_ANALYSIS", regional_cube
+    total_revenue = revenue_cube.total('TOTAL_REVENUE', selection)
+    total_orders = int(revenue_cube.total('TOTAL_ORDERS', selection))
+
+    def scoped(label, table_name):
+        # Thẻ bỏ qua một phần bộ lọc thì ghi rõ các bộ lọc nó thực sự áp dụng
+        if not ignored_filters(table_name, selection):
+            return label
+        return f"{label} ({', '.join(applied_filters(table_name, selection)) or 'không lọc'})"
+
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("💰 Doanh Thu Tổng", f"${total_revenue:,.0f}")
-    col2.metric("📦 Tổng Đơn Hàng", f"{total_orders:,}")
-    col3.metric("👥 Tổng Khách Hàng", f"{total_customers:,}")
+    col1.metric(scoped("💰 Doanh Thu Tổng", revenue_table), f"${total_revenue:,.0f}")
+    col2.metric(scoped("📦 Tổng Đơn Hàng", revenue_table), f"{total_orders:,}")
+    col3.metric(scoped("👥 Tổng Khách Hàng", "CUSTOMER_METRICS"), f"{total_customers:,}")
     
     if total_orders > 0:
         aov = total_revenue / total_orders
-        col4.metric("💵 Giá Trị Đơn TB", f"${aov:,.2f}")
+        col4.metric(scoped("💵 Giá Trị Đơn TB", revenue_table), f"${aov:,.2f}")
     else:
-        col4.metric("💵 Giá Trị Đơn TB", "$0")
+        col4.metric(scoped("💵 Giá Trị Đơn TB", revenue_table), "$0")
 
     st.markdown("---")
 
@@ -137,179 +1969,455 @@ def show_executive_summary(monthly_sales, customer_metrics, regional_analysis):
 
     with col_left:
         st.subheader("📈 Xu Hướng Doanh Thu")
-        monthly_sales['REPORT_DATE'] = pd.to_datetime(monthly_sales['REPORT_DATE'])
-        monthly_sales = monthly_sales.sort_values('REPORT_DATE')
-        
-        # Sửa lỗi: Bỏ markers=True trong hàm px.line để tránh lỗi version cũ
-        fig_trend = px.line(
-            monthly_sales, 
-            x='REPORT_DATE', 
-            y='TOTAL_REVENUE',
-            title='Tăng trưởng doanh thu theo tháng'
+
+        def build_trend():
+            trend = sales_cube.by(('year', 'month'), 'TOTAL_REVENUE', selection)
+            trend['REPORT_DATE'] = pd.to_datetime(trend[['year', 'month']].assign(day=1))
+            # Sửa lỗi: Bỏ markers=True trong hàm px.line để tránh lỗi version cũ
+            fig_trend = px.line(
+                trend, 
+                x='REPORT_DATE', 
+                y='TOTAL_REVENUE',
+                title='Tăng trưởng doanh thu theo tháng'
+            )
+            # Thêm markers bằng update_traces (An toàn hơn)
+            fig_trend.update_traces(line_color='#1f77b4', line_width=3, mode='lines+markers')
+            return fig_trend
+
+        fig_trend = cached_figure(
+            session, "summary/revenue_trend", ("MONTHLY_SALES_REPORT",), build_trend,
+            filters=table_filters("MONTHLY_SALES_REPORT", selection),
         )
-        # Thêm markers bằng update_traces (An toàn hơn)
-        fig_trend.update_traces(line_color='#1f77b4', line_width=3, mode='lines+markers')
         st.plotly_chart(fig_trend, use_container_width=True)
 
     with col_right:
         st.subheader("🌍 Doanh Thu Theo Vùng")
-        if not regional_analysis.empty:
-            region_sum = regional_analysis.groupby('REGION_NAME')['TOTAL_REVENUE'].sum().reset_index()
-            fig_pie = px.pie(
-                region_sum, 
-                values='TOTAL_REVENUE', 
-                names='REGION_NAME',
-                hole=0.4
+        region_revenue = pd.DataFrame()
+        if regional_cube is not None:
+            region_revenue = (regional_cube.by('region', 'TOTAL_REVENUE', selection)
+                .rename(columns={'region': 'REGION_NAME'}))
+        if not region_revenue.empty:
+            fig_pie = cached_figure(
+                session, "summary/region_pie", ("REGIONAL_ANALYSIS",),
+                lambda: px.pie(
+                    region_revenue, 
+                    values='TOTAL_REVENUE', 
+                    names='REGION_NAME',
+                    hole=0.4
+                ),
+                filters=table_filters("REGIONAL_ANALYSIS", selection),
             )
             st.plotly_chart(fig_pie, use_container_width=True)
         else:
             st.info("Không có dữ liệu vùng")
 
-def show_sales_analysis(monthly_sales):
+def show_sales_analysis(session, selection, monthly_sales):
     st.title("📈 Phân Tích Bán Hàng")
     st.markdown("---")
     
     if monthly_sales.empty: return
 
+    sales_by_year(session, selection, monthly_sales)
+
+@component_fragment
+def sales_by_year(session, selection, monthly_sales):
+    """Chọn năm + biểu đồ combo + bảng chi tiết (chạy lại riêng khi đổi năm)"""
     # Filter theo năm
     years = sorted(monthly_sales['YEAR'].unique())
     selected_year = st.selectbox("Chọn Năm", years, index=len(years)-1)
     
-    filtered_df = monthly_sales[monthly_sales['YEAR'] == selected_year]
-
     # Biểu đồ kết hợp (Combo Chart)
     st.subheader(f"Doanh thu & Tăng trưởng năm {selected_year}")
-    
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-    
-    fig.add_trace(
-        go.Bar(x=filtered_df['MONTH_NAME'], y=filtered_df['TOTAL_REVENUE'], name="Doanh Thu"),
-        secondary_y=False
-    )
-    
-    fig.add_trace(
-        go.Scatter(x=filtered_df['MONTH_NAME'], y=filtered_df['MOM_REVENUE_GROWTH'], name="Tăng Trưởng %", mode='lines+markers', line=dict(color='red')),
-        secondary_y=True
+
+    def build_combo():
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        filtered_df = monthly_sales[monthly_sales['YEAR'] == selected_year]
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        
+        fig.add_trace(
+            go.Bar(x=filtered_df['MONTH_NAME'], y=filtered_df['TOTAL_REVENUE'], name="Doanh Thu"),
+            secondary_y=False
+        )
+        
+        fig.add_trace(
+            go.Scatter(x=filtered_df['MONTH_NAME'], y=filtered_df['MOM_REVENUE_GROWTH'], name="Tăng Trưởng %", mode='lines+markers', line=dict(color='red')),
+            secondary_y=True
+        )
+        
+        fig.update_layout(title_text="Doanh thu hàng tháng vs Tăng trưởng MoM")
+        fig.update_yaxes(title_text="Doanh Thu ($)", secondary_y=False)
+        fig.update_yaxes(title_text="Tăng Trưởng (%)", secondary_y=True)
+        return fig
+
+    filters = table_filters("MONTHLY_SALES_REPORT", selection)
+    fig = cached_figure(
+        session, "sales/revenue_vs_mom", ("MONTHLY_SALES_REPORT",), build_combo,
+        year=selected_year, filters=filters,
     )
-    
-    fig.update_layout(title_text="Doanh thu hàng tháng vs Tăng trưởng MoM")
-    fig.update_yaxes(title_text="Doanh Thu ($)", secondary_y=False)
-    fig.update_yaxes(title_text="Tăng Trưởng (%)", secondary_y=True)
-    
     st.plotly_chart(fig, use_container_width=True)
     
-    # Bảng dữ liệu chi tiết
-    st.dataframe(filtered_df[['REPORT_DATE', 'TOTAL_ORDERS', 'TOTAL_REVENUE', 'MOM_REVENUE_GROWTH']], use_container_width=True)
+    # Bảng dữ liệu chi tiết (phân trang phía server)
+    paged_table(
+        session, "MONTHLY_SALES_REPORT",
+        columns=('REPORT_DATE', 'TOTAL_ORDERS', 'TOTAL_REVENUE', 'MOM_REVENUE_GROWTH'),
+        key="sales_detail", default_sort='REPORT_DATE', ascending=True,
+        filters={**dict(filters), "YEAR": selected_year}, page_size=12,
+    )
+
+def build_rfm_scatter(rfm_sample):
+    """Scatter WebGL (Scattergl) trên mẫu phân tầng theo RFM_SEGMENT"""
+    import plotly.express as px
+    return px.scatter(
+        rfm_sample,
+        x='RECENCY_DAYS',
+        y='MONETARY',
+        color='RFM_SEGMENT',
+        size='FREQUENCY',
+        hover_data=['C_NAME'],
+        render_mode='webgl',
+        title=f"Recency vs Monetary (tối đa {RFM_SAMPLE_PER_SEGMENT} khách/phân khúc, kích thước = tần suất)"
+    )
+
+def build_rfm_density(density, bins):
+    """Heatmap mật độ từ lưới đã đếm sẵn trên server (không gửi từng khách)"""
+    import plotly.graph_objects as go
+    grid = (density
+        .pivot_table(index="Y_BIN", columns="X_BIN", values="ROW_COUNT", aggfunc="sum", fill_value=0)
+        .reindex(index=range(bins), columns=range(bins), fill_value=0))
+    first = density.iloc[0]
+    fig = go.Figure(go.Heatmap(
+        z=grid.values,
+        x0=first["X_MIN"] + first["X_STEP"] / 2, dx=first["X_STEP"],
+        y0=first["Y_MIN"] + first["Y_STEP"] / 2, dy=first["Y_STEP"],
+        colorscale="Viridis",
+        colorbar=dict(title="Số khách"),
+        hovertemplate="Recency: %{x:,.0f}<br>Monetary: %{y:,.0f}<br>Số khách: %{z:,}<extra></extra>",
+    ))
+    fig.update_layout(
+        title="Mật độ Recency vs Monetary (toàn bộ khách hàng)",
+        xaxis_title="RECENCY_DAYS",
+        yaxis_title="MONETARY",
+    )
+    return fig
 
-def show_customer_analytics(customer_metrics):
+def show_customer_analytics(session, selection, rfm_sample, segment_counts, top_customers):
     st.title("👥 Phân Tích Khách Hàng")
     st.markdown("---")
     
-    if customer_metrics.empty: return
+    if segment_counts.empty: return
+    import plotly.express as px
 
     col1, col2 = st.columns([2, 1])
 
     with col1:
         st.subheader("🎯 Phân khúc RFM")
-        # Lấy mẫu 1000 khách để vẽ cho nhanh
-        fig_scatter = px.scatter(
-            customer_metrics.head(1000), 
-            x='RECENCY_DAYS',
-            y='MONETARY',
-            color='RFM_SEGMENT',
-            size='FREQUENCY',
-            hover_data=['C_NAME'],
-            title="Recency vs Monetary (Kích thước = Tần suất mua)"
-        )
-        st.plotly_chart(fig_scatter, use_container_width=True)
+        rfm_chart(session, selection, rfm_sample)
 
     with col2:
         st.subheader("📊 Tỷ lệ Phân khúc")
-        seg_counts = customer_metrics['RFM_SEGMENT'].value_counts()
-        fig_bar = px.bar(
-            x=seg_counts.values,
-            y=seg_counts.index,
-            orientation='h',
-            labels={'x': 'Số lượng', 'y': 'Phân khúc'}
+        fig_bar = cached_figure(
+            session, "customers/segment_counts", ("CUSTOMER_METRICS",),
+            lambda: px.bar(
+                segment_counts,
+                x='ROW_COUNT',
+                y='RFM_SEGMENT',
+                orientation='h',
+                labels={'ROW_COUNT': 'Số lượng', 'RFM_SEGMENT': 'Phân khúc'}
+            ),
+            filters=table_filters("CUSTOMER_METRICS", selection),
         )
         st.plotly_chart(fig_bar, use_container_width=True)
 
     st.subheader("🏆 Top 10 Khách Hàng VIP")
-    top_10 = customer_metrics.nlargest(10, 'LIFETIME_VALUE')[['C_NAME', 'C_NATION', 'RFM_SEGMENT', 'LIFETIME_VALUE', 'FREQUENCY']]
-    st.dataframe(top_10, use_container_width=True)
+    st.dataframe(top_customers, use_container_width=True)
+
+    st.subheader("📋 Danh Sách Khách Hàng")
+    paged_table(
+        session, "CUSTOMER_METRICS",
+        columns=('C_CUSTKEY', 'C_NAME', 'C_NATION', 'C_MKTSEGMENT', 'RFM_SEGMENT',
+                 'RECENCY_DAYS', 'FREQUENCY', 'MONETARY', 'LIFETIME_VALUE'),
+        key="customer_list", default_sort='LIFETIME_VALUE', search_column='C_NAME',
+        filters=table_filters("CUSTOMER_METRICS", selection),
+    )
+    export_panel(session, "CUSTOMER_METRICS", selection)
 
-def show_product_performance(product_performance):
+@component_fragment
+def rfm_chart(session, selection, rfm_sample):
+    """Biểu đồ RFM theo chế độ đang chọn (chạy lại riêng khi đổi chế độ)"""
+    mode = st.radio(
+        "Chế độ hiển thị",
+        ["Mẫu phân tầng (WebGL)", "Mật độ toàn bộ khách hàng"],
+        horizontal=True,
+    )
+    filters = table_filters("CUSTOMER_METRICS", selection)
+    if mode == "Mẫu phân tầng (WebGL)":
+        fig = cached_figure(
+            session, "customers/rfm_scatter", ("CUSTOMER_METRICS",), lambda: build_rfm_scatter(rfm_sample),
+            filters=filters,
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        # Lưới mật độ tính trên Snowflake cho toàn bộ khách hàng
+        density = query_aggregate(
+            session, "CUSTOMER_METRICS", "density_2d", selection,
+            n=RFM_DENSITY_BINS, columns=('RECENCY_DAYS', 'MONETARY')
+        )
+        if not density.empty:
+            fig = cached_figure(
+                session, "customers/rfm_density", ("CUSTOMER_METRICS",),
+                lambda: build_rfm_density(density, RFM_DENSITY_BINS), bins=RFM_DENSITY_BINS, filters=filters,
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+def show_product_performance(session, selection):
     st.title("📦 Hiệu Suất Sản Phẩm")
     st.markdown("---")
-    
-    if product_performance.empty: return
 
+    top_products_chart(session)
+    export_panel(session, "PRODUCT_PERFORMANCE", selection)
+
+@component_fragment
+def top_products_chart(session):
+    """Top 15 sản phẩm theo chỉ số đang chọn (chạy lại riêng khi đổi chỉ số)"""
     metric = st.radio("Sắp xếp theo:", ["TOTAL_REVENUE", "TOTAL_QUANTITY_SOLD"], horizontal=True)
     
-    top_products = product_performance.nlargest(15, metric)
-    
-    fig = px.bar(
-        top_products,
-        x=metric,
-        y='P_NAME',
-        orientation='h',
-        color='P_BRAND',
-        title=f"Top 15 Sản phẩm theo {metric}"
+    # Top-N chạy trên Snowflake theo chỉ số đang chọn
+    top_products = query_aggregate(
+        session, "PRODUCT_PERFORMANCE", "top_n",
+        value=metric, n=15, columns=('P_NAME', 'P_BRAND', metric)
+    )
+    if top_products.empty: return
+
+    def build_top_products():
+        import plotly.express as px
+
+        fig = px.bar(
+            top_products,
+            x=metric,
+            y='P_NAME',
+            orientation='h',
+            color='P_BRAND',
+            title=f"Top 15 Sản phẩm theo {metric}"
+        )
+        fig.update_layout(yaxis={'categoryorder':'total ascending'})
+        return fig
+
+    fig = cached_figure(
+        session, "products/top_15", ("PRODUCT_PERFORMANCE",), build_top_products, metric=metric
     )
-    fig.update_layout(yaxis={'categoryorder':'total ascending'})
     st.plotly_chart(fig, use_container_width=True)
 
+def show_customer_lookup(session, selection):
+    st.title("🔍 Tra Cứu Khách Hàng")
+    st.markdown("---")
+    if selection:
+        st.caption("ℹ️ Tra cứu theo mã/tên trên toàn bộ khách hàng, không áp dụng bộ lọc toàn cục.")
+
+    customer_lookup(session)
+
+@component_fragment
+def customer_lookup(session):
+    """Ô tìm kiếm + kết quả (chạy lại riêng khi đổi từ khoá)"""
+    term = st.text_input(
+        "Mã khách hàng (C_CUSTKEY) hoặc tiền tố tên (C_NAME)",
+        placeholder="vd. 42 hoặc Customer#0000001",
+        key="lookup_term",
+    )
+    if not term.strip():
+        return
+    lookup = normalize_lookup(term)
+    if lookup is None:
+        st.info(f"Nhập ít nhất {LOOKUP_MIN_PREFIX} ký tự của tên khách hàng.")
+        return
+
+    by, value = lookup
+    start = time.perf_counter()
+    try:
+        with perf_span("load", f"lookup ({by})") as fields:
+            result = lookup_customers(session, get_table_version(session, "CUSTOMER_METRICS"), by, value)
+            describe_result(fields, result)
+    except Exception as e:
+        st.error(f"Lỗi khi tra cứu khách hàng: {e}")
+        return
+    elapsed = time.perf_counter() - start
+
+    if result.empty:
+        st.warning("Không tìm thấy khách hàng phù hợp.")
+        return
+    if by == "key":
+        customer = result.iloc[0]
+        st.subheader(customer["C_NAME"])
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Phân khúc RFM", customer["RFM_SEGMENT"])
+        c2.metric("Lifetime Value", f"${customer['LIFETIME_VALUE']:,.2f}")
+        c3.metric("Số đơn hàng", f"{customer['FREQUENCY']:,}")
+        c4.metric("Ngày từ đơn cuối", f"{customer['RECENCY_DAYS']:,}")
+    st.dataframe(result, use_container_width=True, hide_index=True)
+    more = " (có thể còn nữa, hãy nhập tiền tố dài hơn)" if len(result) >= LOOKUP_LIMIT else ""
+    st.caption(f"{len(result)} khách hàng{more} · {elapsed * 1000:,.0f} ms")
+
 # =============================================================================
 # 5. CHƯƠNG TRÌNH CHÍNH (MAIN)
 # =============================================================================
 
+# Mỗi trang khai báo hàm hiển thị và các dataset nó cần. main() chỉ tải đúng
+# các dataset của trang đang mở; trang mới chỉ cần thêm một mục vào PAGES.
+# Hàm hiển thị nhận session, lựa chọn bộ lọc toàn cục và các dataset dưới
+# dạng keyword argument; tables là các bảng mà bộ lọc toàn cục áp dụng trên
+# trang (để báo bộ lọc nào không áp dụng được).
+PAGES = {
+    "🏠 Executive Summary": {
+        "render": show_executive_summary,
+        "datasets": ("sales_cube", "total_customers", "regional_cube"),
+        "tables": ("MONTHLY_SALES_REPORT", "CUSTOMER_METRICS", "REGIONAL_ANALYSIS"),
+    },
+    "📈 Sales Analysis": {
+        "render": show_sales_analysis,
+        "datasets": ("monthly_sales",),
+        "tables": ("MONTHLY_SALES_REPORT",),
+    },
+    "👥 Customer Analytics": {
+        "render": show_customer_analytics,
+        "datasets": ("rfm_sample", "segment_counts", "top_customers"),
+        "tables": ("CUSTOMER_METRICS",),
+    },
+    "📦 Product Performance": {
+        "render": show_product_performance,
+        "datasets": (),
+        "tables": ("PRODUCT_PERFORMANCE",),
+    },
+    "🔍 Tra Cứu Khách Hàng": {
+        "render": show_customer_lookup,
+        "datasets": (),
+        "tables": (),
+    },
+}
+
+for _label, _page in PAGES.items():
+    _unknown = set(_page["datasets"]) - set(DATASETS)
+    assert not _unknown, f"Trang {_label} khai báo dataset không tồn tại: {_unknown}"
+
 def main():
+    # Bắt đầu mở session ở nền trước khi vẽ gì: sidebar và khung trang hiện
+    # ngay trong lúc Snowpark được import và đăng nhập
+    pool = get_session_pool()
+    pool.prewarm()
+
     # Sidebar Navigation
     st.sidebar.title("📊 TPC-H Analytics")
-    
+    connection_status = st.sidebar.empty()
+    page = st.sidebar.radio("Điều hướng", list(PAGES), key="page")
+
+    skeleton = st.empty()
+    if not pool.connected:
+        connection_status.info("⏳ Đang kết nối...")
+        with skeleton.container():
+            st.title(page)
+            st.caption("⏳ Đang kết nối và tải dữ liệu...")
+
+    start = time.perf_counter()
     try:
-        session = create_session()
-        # Hiển thị thông tin kết nối an toàn hơn
-        try:
-            db = session.get_current_database()
-            sch = session.get_current_schema()
-            st.sidebar.success(f"✅ Đã kết nối: {db}.{sch}")
-        except:
-            st.sidebar.success("✅ Đã kết nối thành công!")
-            
-    except Exception as e:
+        with page_session(page) as session:
+            skeleton.empty()
+            # Hiển thị thông tin kết nối (đọc một lần khi pool mở session đầu tiên)
+            if pool.label:
+                connection_status.success(f"✅ Đã kết nối: {pool.label}")
+            else:
+                connection_status.success("✅ Đã kết nối thành công!")
+            render_page(session, page)
+    except pool.Busy:
+        st.warning("⏳ Đang có nhiều người dùng truy cập cùng lúc. Vui lòng thử lại sau giây lát.")
+        st.button("Thử lại")
+    except pool.ConnectError as e:
         st.error(f"❌ Lỗi kết nối: {e}")
         st.info("💡 Nếu chạy trên Streamlit Cloud, hãy kiểm tra phần Settings > Secrets.")
         st.stop()
+    record_rerun_latency("toàn trang", time.perf_counter() - start)
 
-    page = st.sidebar.radio("Điều hướng", [
-        "🏠 Executive Summary",
-        "📈 Sales Analysis",
-        "👥 Customer Analytics",
-        "📦 Product Performance"
-    ])
-
+def render_page(session, page):
+    """Sidebar phụ thuộc dữ liệu + trang đang mở, chạy với session mượn từ pool"""
     st.sidebar.markdown("---")
     if st.sidebar.button("🔄 Làm mới dữ liệu"):
-        st.cache_data.clear()
+        # Chỉ kiểm tra lại fingerprint và kéo phần thay đổi, không xoá toàn bộ cache
+        st.session_state["refresh_report"] = refresh_all_snapshots(session)
         st.rerun()
+    for table_name, status in st.session_state.pop("refresh_report", {}).items():
+        st.sidebar.caption(f"{table_name}: {status}")
+
+    page_spec = PAGES[page]
+    selection = global_filter_sidebar(session)
+    for table_name in page_spec["tables"]:
+        ignored = ignored_filters(table_name, selection)
+        if ignored:
+            st.sidebar.caption(f"ℹ️ {table_name} không có cột cho bộ lọc: {', '.join(ignored)}")
+
+    # Chỉ tải các dataset mà trang đang mở khai báo (song song)
+    data = {}
+    if page_spec["datasets"]:
+        with st.spinner("Đang tải dữ liệu từ Snowflake..."):
+            data, timings = load_datasets(session, page_spec["datasets"], selection)
+        show_load_timings(timings)
 
-    # Load dữ liệu (Đã sửa để dùng tên đầy đủ trong hàm load_data)
-    with st.spinner("Đang tải dữ liệu từ Snowflake..."):
-        monthly_sales = load_data(session, "MONTHLY_SALES_REPORT")
-        customer_metrics = load_data(session, "CUSTOMER_METRICS")
-        product_performance = load_data(session, "PRODUCT_PERFORMANCE")
-        regional_analysis = load_data(session, "REGIONAL_ANALYSIS")
+    show_data_freshness()
+    show_pool_status()
+    show_cache_stats()
+    show_rerun_latency()
 
     # Routing trang
-    if page == "🏠 Executive Summary":
-        show_executive_summary(monthly_sales, customer_metrics, regional_analysis)
-    elif page == "📈 Sales Analysis":
-        show_sales_analysis(monthly_sales)
-    elif page == "👥 Customer Analytics":
-        show_customer_analytics(customer_metrics)
-    elif page == "📦 Product Performance":
-        show_product_performance(product_performance)
+    with perf_span("render", page_spec["render"].__name__):
+        page_spec["render"](session, selection, **data)
+    show_perf_panel()
+
+# Lựa chọn của từng bộ lọc: (widget key trong session_state, bảng + cột lấy
+# danh sách giá trị). Quốc gia chỉ hiện các nước thuộc vùng đang chọn.
+FILTER_OPTIONS = {
+    "region": ("REGIONAL_ANALYSIS", "REGION_NAME"),
+    "nation": ("REGIONAL_ANALYSIS", "NATION_NAME"),
+    "year": ("REGIONAL_ANALYSIS", "YEAR"),
+    "quarter": ("REGIONAL_ANALYSIS", "QUARTER"),
+    "segment": ("CUSTOMER_METRICS", "C_MKTSEGMENT"),
+}
+
+def _clear_global_filters():
+    for name in GLOBAL_FILTERS:
+        st.session_state[f"filter_{name}"] = []
+
+def global_filter_sidebar(session):
+    """Bộ lọc toàn cục ở sidebar, trả về lựa chọn đã chuẩn hoá (khoá cache ổn định)"""
+    # Danh sách giá trị: một truy vấn DISTINCT mỗi bảng, cache theo phiên bản bảng
+    options = {}
+    for table_name in dict.fromkeys(table for table, _ in FILTER_OPTIONS.values()):
+        columns = tuple(column for table, column in FILTER_OPTIONS.values() if table == table_name)
+        options[table_name] = query_aggregate(session, table_name, "distinct", columns=columns)
+
+    chosen = {}
+    with st.sidebar.expander("🔎 Bộ lọc", expanded=True):
+        for name, (table_name, column) in FILTER_OPTIONS.items():
+            frame = options[table_name]
+            if column not in frame:
+                continue
+            if name == "nation" and chosen.get("region"):
+                frame = frame[frame["REGION_NAME"].isin(chosen["region"])]
+            values = sorted(frame[column].dropna().unique().tolist())
+            key = f"filter_{name}"
+            # Bỏ giá trị không còn trong danh sách (vd. quốc gia của vùng vừa bỏ chọn)
+            if key in st.session_state:
+                st.session_state[key] = [v for v in st.session_state[key] if v in values]
+            chosen[name] = st.multiselect(GLOBAL_FILTERS[name], values, key=key)
+        st.button("Xoá bộ lọc", on_click=_clear_global_filters)
+    return normalize_filters(chosen)
+
+def show_pool_status():
+    """Trạng thái pool kết nối trong sidebar"""
+    pool = get_session_pool()
+    stats = pool.stats
+    mode = "dùng chung" if pool.shared else f"tối đa {pool.size}"
+    st.sidebar.caption(
+        f"🔌 Pool ({pool.source}, {mode}): {stats['in_use']} đang dùng, "
+        f"{stats['created']} đã mở, {stats['reconnects']} kết nối lại, {stats['busy']} từ chối"
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Kiểm thử dashboard trên backend local (dữ liệu mẫu sinh bằng
+benchmarks/make_local_data.py, không cần Snowflake).
+
+Chạy:
+    pytest tests
+"""
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "streamlit_dashboard_cloud.py")
+
+
+@pytest.fixture(scope="module")
+def local_data(tmp_path_factory):
+    data_dir = str(tmp_path_factory.mktemp("tpch_local") / "data")
+    subprocess.run([
+        sys.executable, os.path.join(ROOT, "benchmarks", "make_local_data.py"),
+        "--out", data_dir, "--customers", "3000", "--products", "2000",
+    ], check=True, stdout=subprocess.DEVNULL)
+    return data_dir
+
+
+@pytest.fixture(scope="module")
+def dashboard():
+    sys.path.insert(0, ROOT)
+    import streamlit_dashboard_cloud
+    return streamlit_dashboard_cloud
+
+
+@pytest.fixture
+def app(local_data, tmp_path, monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    monkeypatch.setenv("TPCH_DASHBOARD_BACKEND", "local")
+    monkeypatch.setenv("TPCH_DASHBOARD_LOCAL_DIR", local_data)
+    monkeypatch.setenv("TPCH_DASHBOARD_CACHE_DIR", str(tmp_path / "cache"))
+    return AppTest.from_file(APP, default_timeout=120)
+
+
+def metric(at, label):
+    """Giá trị của thẻ KPI có nhãn bắt đầu bằng label"""
+    return next(m.value for m in at.metric if m.label.startswith(label))
+
+
+def test_kpi_cards_follow_the_region_filter(app, local_data):
+    app.run()
+    app.multiselect(key="filter_region").set_value(["ASIA"])
+    app.multiselect(key="filter_year").set_value([1995]).run()
+    assert not app.exception
+
+    regional = pd.read_parquet(os.path.join(local_data, "REGIONAL_ANALYSIS.parquet"))
+    regional = regional[(regional["REGION_NAME"] == "ASIA") & (regional["YEAR"] == 1995)]
+    customers = pd.read_parquet(os.path.join(local_data, "CUSTOMER_METRICS.parquet"))
+    revenue, orders = regional["TOTAL_REVENUE"].sum(), int(regional["TOTAL_ORDERS"].sum())
+
+    assert metric(app, "💰 Doanh Thu Tổng") == f"${revenue:,.0f}"
+    assert metric(app, "📦 Tổng Đơn Hàng") == f"{orders:,}"
+    assert metric(app, "👥 Tổng Khách Hàng") == f"{int((customers['C_REGION'] == 'ASIA').sum()):,}"
+    assert metric(app, "💵 Giá Trị Đơn TB") == f"${revenue / orders:,.2f}"
+    # CUSTOMER_METRICS không có cột năm: thẻ ghi rõ bộ lọc nó áp dụng
+    assert any(m.label == "👥 Tổng Khách Hàng (Vùng)" for m in app.metric)
+
+
+@pytest.mark.parametrize("term, expected", [
+    (" 42 ", ("key", 42)),
+    ("customer#01", ("name", "CUSTOMER#01")),
+    ("cust", None),
+    ("²", None),
+    ("٣٣٣٣٣", ("name", "٣٣٣٣٣")),
+])
+def test_normalize_lookup(dashboard, term, expected):
+    assert dashboard.normalize_lookup(term) == expected
+
+
+def test_lookup_with_non_ascii_digits_does_not_crash(app):
+    app.run()
+    app.sidebar.radio[0].set_value("🔍 Tra Cứu Khách Hàng").run()
+    app.text_input[0].set_value("²³").run()
+    assert not app.exception
+
+
+def test_concurrent_first_loads_share_one_entry(dashboard, local_data):
+    import threading
+    import time
+
+    session = dashboard.LocalSession.from_parquet(local_data)
+    backend = session.dashboard_backend
+    fingerprint, calls = backend.fingerprint, []
+
+    def slow_fingerprint(table_name):
+        calls.append(table_name)
+        time.sleep(0.05)
+        return fingerprint(table_name)
+
+    backend.fingerprint = slow_fingerprint
+    table_name = "REGIONAL_ANALYSIS"
+    dashboard._snapshot_store()["tables"].pop(table_name, None)
+    # Luồng cần dữ liệu chạy trước, các luồng chỉ cần phiên bản không được xoá df của nó
+    threads = [threading.Thread(target=dashboard._get_entry, args=(session, table_name, i == 0))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+    assert calls == [table_name]
+    assert dashboard._snapshot_store()["tables"][table_name]["df"] is not None